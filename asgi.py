@@ -0,0 +1,211 @@
+from quart import Quart
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import HTTPException
+from async_imports import *
+from main import app as wsgi_app
+from parts import to_part_listing, to_part_detail, part_detail, part_overview, part_overview_find, part_listing_pipeline, PART_FIELDS, INVALID_LIMIT_ERROR
+from sets import to_set_listing, set_overview_projection, wants_field, set_detail, SET_FIELDS, SET_DETAIL_FIELDS
+from colors import page_color_ids, color_listing, color_detail
+from popularity import record_visit
+from leaderboards import LEADERBOARDS_BUILT_KEY, ranking_range, order_overviews, parse_count, leaderboard_response
+from part_colors import parts_by_color_pipeline
+from part_index import part_sets_find
+
+# Async serving mode: run with `uvicorn asgi:app`.
+# Read routes are served by coroutines on Motor and redis.asyncio, every
+# other route falls through to the regular Flask app.
+async_app = Quart(__name__)
+async_parts_api = Blueprint('async_parts_api', __name__)
+async_sets_api = Blueprint('async_sets_api', __name__)
+async_colors_api = Blueprint('async_colors_api', __name__)
+
+PARTS_COLLECTION = ASYNC_DB['parts']
+PART_SET_INDEX_COLLECTION = ASYNC_DB['part_set_index']
+SET_OVERVIEWS_COLLECTION = ASYNC_DB['set_overviews']
+SET_OFFERS_COLLECTION = ASYNC_DB['set_offers']
+SET_CONTENTS_COLLECTION = ASYNC_DB['set_contents']
+
+# COLORS
+async def list_colors(after=None, limit=None):
+    color_ids = page_color_ids(await ASYNC_REDIS.keys("colors:*"), after, limit)
+    pipe = ASYNC_REDIS.pipeline(transaction=False)
+    for color_id in color_ids:
+        pipe.hgetall(f"colors:{color_id}")
+    return color_listing(color_ids, await pipe.execute())
+
+@async_colors_api.route('')
+async def get_colors():
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after')
+
+    if wants_ndjson(request.accept_mimetypes):
+        results = await list_colors(after, limit)
+        return Response(''.join(json.dumps(color) + '\n' for color in results), mimetype=NDJSON_MIMETYPE)
+
+    @async_redis_cache(module='colors', expire=600, limit=limit, tags=('colors',))
+    async def sub_get_colors(after):
+        results = await list_colors(after, limit)
+        return jsonify(results), 200, next_page_headers(request.base_url, request.args.to_dict(), results, limit)
+
+    return await sub_get_colors(after)
+
+@async_colors_api.route('/<id>')
+@async_redis_cache(module='colors', expire=600, tags=('colors',))
+async def get_color(id):
+    body, status = color_detail(id, await ASYNC_REDIS.hgetall(f'colors:{id}'))
+    return jsonify(body), status
+
+# PARTS
+@async_parts_api.route('')
+async def get_parts():
+    limit = request.args.get('limit', default=25, type=int)
+    after = request.args.get('after')
+    projection, error = field_projection(request.args.get('fields'), PART_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    if wants_ndjson(request.accept_mimetypes):
+        pipeline = part_listing_pipeline(after, projection, limit if 'limit' in request.args else None)
+        return stream_ndjson(PARTS_COLLECTION.aggregate(pipeline), to_part_listing)
+
+    @async_redis_cache(module='parts', expire=600, limit=limit, tags=('parts',), stale=60)
+    async def sub_get_parts(after, fields):
+        result = await PARTS_COLLECTION.aggregate(part_listing_pipeline(after, projection, limit)).to_list(length=None)
+        new_res = [to_part_listing(part) for part in result]
+        return jsonify(new_res), 200, next_page_headers(request.base_url, request.args.to_dict(), new_res, limit)
+
+    return await sub_get_parts(after, ','.join(projection) if projection else None)
+
+@async_parts_api.route('/<id>')
+async def get_part(id):
+    projection, error = field_projection(request.args.get('fields'), PART_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    @async_redis_cache(module='parts', expire=600, tags=('part:{id}',))
+    async def sub_get_part(id, fields):
+        body, status = part_detail(await PARTS_COLLECTION.find_one(**by_id_find(id, projection)))
+        return jsonify(body), status
+
+    return await sub_get_part(id, ','.join(projection) if projection else None)
+
+@async_parts_api.route('/colors/<color>')
+async def get_parts_by_color(color):
+    limit = request.args.get('limit', default=25, type=int)
+
+    @async_redis_cache(module='parts', expire=600, limit=limit, tags=('parts', 'parts:offers'))
+    async def sub_get_by_color(color):
+        if not limit:
+            return jsonify({'error': INVALID_LIMIT_ERROR}), 400
+
+        aggregation = parts_by_color_pipeline(color, limit)
+        result = await PARTS_COLLECTION.aggregate(aggregation).to_list(length=None)
+        return jsonify([to_part_detail(part) for part in result]), 200
+
+    return await sub_get_by_color(color)
+
+@async_parts_api.route('/<id>/colors')
+@async_redis_cache(module='parts', expire=600, tags=('part:{id}', 'colors'))
+async def get_part_overview(id):
+    body, status = part_overview(await PARTS_COLLECTION.find_one(**part_overview_find(id)))
+    return jsonify(body), status
+
+@async_parts_api.route('/<id>/sets')
+async def get_part_sets(id):
+    color = request.args.get('color')
+
+    @async_redis_cache(module='parts', expire=600, tags=('sets',))
+    async def sub_get_part_sets(id, color):
+        return jsonify(await PART_SET_INDEX_COLLECTION.find(**part_sets_find(id, color)).to_list(length=None)), 200
+
+    return await sub_get_part_sets(id, color)
+
+# SETS
+@async_sets_api.route('')
+async def get_sets():
+    limit = request.args.get('limit', 25)
+    after = request.args.get('after')
+    projection, error = field_projection(request.args.get('fields'), SET_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    if wants_ndjson(request.accept_mimetypes):
+        cursor = SET_OVERVIEWS_COLLECTION.find(**listing_find(after, projection, limit if 'limit' in request.args else None))
+        return stream_ndjson(cursor, to_set_listing)
+
+    @async_redis_cache(module='sets', expire=600, limit=limit, tags=('sets',), stale=60)
+    async def sub_get_sets(after, fields):
+        result = await SET_OVERVIEWS_COLLECTION.find(**listing_find(after, projection, limit)).to_list(length=None)
+        result = [to_set_listing(set) for set in result]
+        return jsonify(result), 200, next_page_headers(request.base_url, request.args.to_dict(), result, int(limit))
+
+    return await sub_get_sets(after, ','.join(projection) if projection else None)
+
+async def _find_one_if(wanted, collection, find):
+    return await collection.find_one(**find) if wanted else None
+
+@async_sets_api.route('/<id>')
+async def get_set(id):
+    projection, error = field_projection(request.args.get('fields'), SET_DETAIL_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    @async_redis_cache(module='sets', expire=600, tags=('set:{id}',), stale=60)
+    async def sub_get_set(id, fields):
+        # The overview, offers and contents live in separate collections, fetch the requested ones at once
+        result, contents, offers = await asyncio.gather(
+            SET_OVERVIEWS_COLLECTION.find_one(**by_id_find(id, set_overview_projection(projection))),
+            _find_one_if(wants_field(projection, 'parts'), SET_CONTENTS_COLLECTION, by_id_find(id, {"parts": 1})),
+            _find_one_if(wants_field(projection, 'offers'), SET_OFFERS_COLLECTION, by_id_find(id, {"offers": 1}))
+        )
+        body, status = set_detail(result, contents, offers)
+        return jsonify(body), status
+
+    response = await sub_get_set(id, ','.join(projection) if projection else None)
+    if response.status_code == 200:
+        record_visit(id)
+    return response
+
+async def ranked_overviews(board, count):
+    """The overviews of the top `count` sets of a leaderboard, None while the leaderboards were never built."""
+    if not await ASYNC_REDIS.exists(LEADERBOARDS_BUILT_KEY):
+        return None
+    key, start, end, descending = ranking_range(board, count)
+    set_ids = await ASYNC_REDIS.zrange(key, start, end, desc=descending)
+    return order_overviews(set_ids, await SET_OVERVIEWS_COLLECTION.find(**by_ids_find(set_ids)).to_list(length=None))
+
+async def leaderboard(board, x):
+    count = parse_count(x)
+    overviews = await ranked_overviews(board, count) if count is not None else None
+    body, status = leaderboard_response(count, overviews)
+    return jsonify(body), status
+
+@async_sets_api.route('/profitable/<x>')
+@async_redis_cache(module='sets', expire=600, tags=('sets',))
+async def get_profitable_sets(x):
+    return await leaderboard('profitable', x)
+
+@async_sets_api.route('/cheapest/new/<x>')
+@async_redis_cache(module='sets', expire=600, tags=('sets',))
+async def get_cheapest_new_sets(x):
+    return await leaderboard('cheapest_new', x)
+
+@async_sets_api.route('/cheapest/used/<x>')
+@async_redis_cache(module='sets', expire=600, tags=('sets',))
+async def get_cheapest_used_sets(x):
+    return await leaderboard('cheapest_used', x)
+
+async_app.register_blueprint(async_parts_api, url_prefix='/parts')
+async_app.register_blueprint(async_colors_api, url_prefix='/colors')
+async_app.register_blueprint(async_sets_api, url_prefix='/sets')
+
+fallback_app = WsgiToAsgi(wsgi_app)
+
+async def app(scope, receive, send):
+    '''ASGI entry point dispatching between the async routes and the Flask app.'''
+    if scope['type'] == 'http':
+        try:
+            async_app.url_map.bind('').match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return await fallback_app(scope, receive, send)
+    return await async_app(scope, receive, send)
@@ -0,0 +1,114 @@
+from quart import Blueprint, request, jsonify, Response, make_response
+from motor.motor_asyncio import AsyncIOMotorClient
+import redis.asyncio as aioredis
+import asyncio
+from imports import (
+    LOCAL_CACHE, LOCAL_CACHE_MAX_TTL, CACHE_LOCK_TIMEOUT, CACHE_LOCK_WAIT,
+    cache_key, parse_cache_entry, encode_cache_entry, decode_cache_entry,
+    NDJSON_MIMETYPE, wants_ndjson, keyset_filter, next_page_headers, field_projection,
+    by_id_find, by_ids_find, listing_find,
+    _start_invalidation_listener,
+)
+import inspect
+import json
+import os
+import time
+import uuid
+
+# Async counterparts of the clients in imports.py, used by the ASGI serving mode
+ASYNC_CLIENT = AsyncIOMotorClient(os.getenv('MONGO_URI'), w="majority", journal=True, readPreference='primaryPreferred')
+ASYNC_REDIS = aioredis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), decode_responses=True)
+ASYNC_REDIS_CACHE = aioredis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), decode_responses=False)
+ASYNC_DB = ASYNC_CLIENT['bricks']
+
+_RELEASE_LOCK = ASYNC_REDIS.register_script(
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+)
+
+async def _read_cache_entry(query, entry_tags):
+    pipe = ASYNC_REDIS_CACHE.pipeline(transaction=False)
+    pipe.hgetall(query)
+    pipe.pttl(query)
+    if entry_tags:
+        pipe.mget([f"cache:gen:{tag}" for tag in entry_tags])
+    found, ttl, *gens = await pipe.execute(raise_on_error=False)
+    return parse_cache_entry(found, gens[0] if gens else None) + (ttl,)
+
+def stream_ndjson(cursor, transform=None):
+    '''Stream documents from a Motor cursor one per line.'''
+    async def lines():
+        async for doc in cursor:
+            yield (json.dumps(transform(doc) if transform else doc, default=str) + '\n').encode()
+    return Response(lines(), mimetype=NDJSON_MIMETYPE)
+
+def _cached_response(entry):
+    body, headers = decode_cache_entry(entry, 'deflate' in request.accept_encodings)
+    return Response(body, status=int(entry['status']), content_type=entry['ct'].decode(), headers=headers)
+
+def async_redis_cache(module, expire=60, limit=None, tags=(), stale=0):
+    '''Async version of imports.redis_cache for coroutine views.
+
+    Uses the same keys, entry format, tag generations, local tier and
+    single-flight lock, so the sync and async serving modes share one cache.
+
+    Args:
+        module (str): The module name.
+        expire (int): The expiration time in minutes (soft TTL when `stale` is set).
+        tags (tuple): Tag templates formatted with the call arguments, e.g. "part:{id}".
+        stale (int): Minutes an expired value may still be served while it is refreshed.
+    '''
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        async def wrap(*args, **kwargs):
+            _start_invalidation_listener()
+            query = cache_key(module, func.__name__, limit, args, kwargs)
+
+            if (a:=LOCAL_CACHE.get(query)) is not None:
+                LOCAL_CACHE.record(module, 'local_hits')
+                return _cached_response(a)
+
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            entry_tags = [tag.format(**arguments) for tag in tags]
+
+            found, generation, ttl = await _read_cache_entry(query, entry_tags)
+            fresh_for = float(found.get('soft', 0)) - time.time() if found else 0
+            if found and fresh_for > 0:
+                LOCAL_CACHE.record(module, 'redis_hits')
+                LOCAL_CACHE.set(query, found, min(fresh_for, ttl / 1000, LOCAL_CACHE_MAX_TTL), size=len(found['body']), tags=entry_tags)
+                return _cached_response(found)
+
+            token = uuid.uuid4().hex
+            if not await ASYNC_REDIS.set(f"lock:{query}", token, nx=True, px=CACHE_LOCK_TIMEOUT):
+                token = None
+                if found:
+                    LOCAL_CACHE.record(module, 'stale_hits')
+                    return _cached_response(found)
+                deadline = time.monotonic() + CACHE_LOCK_WAIT
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    found, generation, _ = await _read_cache_entry(query, entry_tags)
+                    if found:
+                        LOCAL_CACHE.record(module, 'redis_hits')
+                        return _cached_response(found)
+
+            LOCAL_CACHE.record(module, 'misses')
+            try:
+                response = await make_response(await func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = encode_cache_entry(await response.get_data(), response.content_type, response.status_code, response.headers)
+                pipe = ASYNC_REDIS_CACHE.pipeline()
+                pipe.delete(query)
+                pipe.hset(query, mapping=entry | {'gen': generation, 'soft': time.time() + expire*60})
+                pipe.expire(query, (expire + stale)*60)
+                await pipe.execute()
+                LOCAL_CACHE.set(query, entry, min(expire*60, LOCAL_CACHE_MAX_TTL), size=len(entry['body']), tags=entry_tags)
+                return response
+            finally:
+                if token:
+                    await _RELEASE_LOCK(keys=[f"lock:{query}"], args=[token])
+        wrap.__name__ = func.__name__
+        return wrap
+    return decorator
@@ -0,0 +1,64 @@
+from imports import *
+from imports import _start_invalidation_listener
+
+# Process-wide color maps, loaded once from the colors:<id> hashes and dropped
+# whenever the 'colors' tag is invalidated (colors_api writes), so lookups
+# cost no I/O in between
+_lock = threading.Lock()
+_version = 0
+_names = None
+_ids = None
+
+def _load():
+    global _names, _ids
+    _start_invalidation_listener()
+    with _lock:
+        version = _version
+    keys = [key for key in REDIS.scan_iter('colors:*') if key.count(':') == 1]
+    pipe = REDIS.pipeline(transaction=False)
+    for key in keys:
+        pipe.hget(key, 'name')
+    names = {key.split(':')[1]: name for key, name in zip(keys, pipe.execute()) if name is not None}
+    ids = {name.lower(): color_id for color_id, name in names.items()}
+    with _lock:
+        # An invalidation during the load means the maps may already be stale
+        if version == _version:
+            _names, _ids = names, ids
+    return names, ids
+
+def _maps():
+    names, ids = _names, _ids
+    if names is None:
+        names, ids = _load()
+    return names, ids
+
+def reset():
+    global _version, _names, _ids
+    with _lock:
+        _version += 1
+        _names, _ids = None, None
+
+def color_names():
+    """
+    Returns:
+        dict: {color_id: name}, ids are strings.
+    """
+    return _maps()[0]
+
+def color_name(color_id, default=None):
+    return color_names().get(str(color_id), default)
+
+def find_color_id(color):
+    """
+    Resolve a color name (case-insensitive) or an existing color id.
+
+    Returns:
+        str: The color id, None for unknown colors.
+    """
+    names, ids = _maps()
+    color = str(color).strip()
+    if color in names:
+        return color
+    return ids.get(color.lower())
+
+on_invalidate('colors', reset)
@@ -2,24 +2,62 @@ from imports import *
 
 colors_api = Blueprint('colors_api', __name__)
 
-@colors_api.route('')
-@redis_cache(module='colors')
-def get_colors():
+def color_sort_key(color_id):
+    # Numeric order for the integer ids without parsing them
+    return (len(color_id), color_id)
+
+def page_color_ids(keys, after=None, limit=None):
+    """The ids of one page of colors from their `colors:*` keys, ordered by id and starting after the `after` id."""
+    color_ids = sorted((key.split(":")[1] for key in keys), key=color_sort_key)
+    if after is not None:
+        color_ids = [color_id for color_id in color_ids if color_sort_key(color_id) > color_sort_key(after)]
+    if limit:
+        color_ids = color_ids[:limit]
+    return color_ids
+
+def color_listing(color_ids, hashes):
+    """Colors from their ids and their hashes, read in the same order."""
     results = []
-    for key in REDIS.keys("colors:*"):
-        values = REDIS.hgetall(key)
-        values["_id"] = key.split(":")[1]
+    for color_id, values in zip(color_ids, hashes):
+        values["_id"] = color_id
         results.append(values)
-    return jsonify(results), 200
+    return results
+
+def color_detail(id, values):
+    """Body and status of the color route for the hash stored under `colors:{id}`."""
+    if not values:
+        return {'error': 'Color not found'}, 404
+    values["_id"] = id
+    return values, 200
+
+def list_colors(after=None, limit=None):
+    """Colors ordered by id, starting after the `after` id."""
+    color_ids = page_color_ids(REDIS.keys("colors:*"), after, limit)
+    pipe = REDIS.pipeline(transaction=False)
+    for color_id in color_ids:
+        pipe.hgetall(f"colors:{color_id}")
+    return color_listing(color_ids, pipe.execute())
+
+@colors_api.route('')
+def get_colors():
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after')
+
+    if wants_ndjson(request.accept_mimetypes):
+        return stream_ndjson(list_colors(after, limit))
+
+    @redis_cache(module='colors', expire=600, limit=limit, tags=('colors',))
+    def sub_get_colors(after):
+        results = list_colors(after, limit)
+        return jsonify(results), 200, next_page_headers(request.base_url, request.args.to_dict(), results, limit)
+
+    return sub_get_colors(after)
 
 @colors_api.route('/<id>')
-@redis_cache(module='colors')
+@redis_cache(module='colors', expire=600, tags=('colors',))
 def get_color(id):
-    result = REDIS.hgetall(f'colors:{id}')
-    result["_id"] = id
-    if not result:
-        return jsonify({'error': 'Color not found'}), 404
-    return jsonify(result), 200
+    body, status = color_detail(id, REDIS.hgetall(f'colors:{id}'))
+    return jsonify(body), status
 
 #  add new color (include id in request)
 @colors_api.route('', methods=['POST'])
@@ -41,6 +79,7 @@ def add_color():
             return jsonify({'error': f'Color with _id {new_color["_id"]} already exists'}), 409
 
         REDIS.hmset(f'colors:{new_color["_id"]}', new_color)
+        invalidate('colors')
 
         new_color['_id'] = str(new_color['_id'])
         return jsonify(new_color), 200
@@ -58,6 +97,7 @@ def update_color(id):
 
     try:
         REDIS.hmset(f'colors:{id}', updated_data)
+        invalidate('colors')
         return jsonify({'message': 'Color updated successfully', 'color': id}), 200
     
     except Exception as e:
@@ -67,7 +107,8 @@ def update_color(id):
 @colors_api.route('/<id>', methods=['DELETE'])
 def delete_color(id):
     try:
-        REDIS.hdel(f'colors:{id}')
+        REDIS.delete(f'colors:{id}')
+        invalidate('colors')
         return jsonify({'message': 'Color deleted successfully'}), 200
     
     except Exception as e:
@@ -1,16 +1,51 @@
-from flask import Flask, Blueprint, request, jsonify
-from pymongo.errors import DuplicateKeyError
+from flask import Flask, Blueprint, request, jsonify, Response, make_response, stream_with_context
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from pymongo import MongoClient, WriteConcern
 import redis
 from dotenv import load_dotenv
 import os
 import time
+import json
+import inspect
+import threading
+import uuid
+import zlib
+from urllib.parse import urlencode
+from local_cache import LocalCache
 load_dotenv()
 
 CLIENT = MongoClient(os.getenv('MONGO_URI'), w="majority", journal=True, readPreference='primaryPreferred')
 REDIS = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), decode_responses=True)
+# Cached responses are stored as raw bytes, so they need a client that does not decode
+REDIS_CACHE = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), decode_responses=False)
 DB = CLIENT['bricks']
 
+# Per-worker first cache tier, Redis stays the shared second tier
+LOCAL_CACHE = LocalCache(
+    max_entries=int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', 2048)),
+    max_bytes=int(os.getenv('LOCAL_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+)
+# Upper bound on local staleness in case an invalidation message is missed
+LOCAL_CACHE_MAX_TTL = int(os.getenv('LOCAL_CACHE_MAX_TTL', 60))
+INVALIDATION_CHANNEL = 'cache:invalidate'
+# Response bodies at least this large are stored zlib-compressed
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv('CACHE_COMPRESS_MIN_BYTES', 1024))
+# Response headers that are stored together with cached bodies
+CACHED_HEADERS = ('Link', 'X-Next-Cursor')
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Default number of operations sent per bulk_write by the _bulk endpoints
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 500))
+_invalidation_listener = None
+# Single-flight recomputation: lock lifetime in ms and how long waiters poll for the result in seconds
+CACHE_LOCK_TIMEOUT = int(os.getenv('CACHE_LOCK_TIMEOUT', 10000))
+CACHE_LOCK_WAIT = float(os.getenv('CACHE_LOCK_WAIT', 5))
+_RELEASE_LOCK = REDIS.register_script(
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+)
+_invalidation_lock = threading.Lock()
+# {tag: [callbacks]} run in every worker when the tag is invalidated
+_invalidation_hooks = {}
+
 def timeit(func): 
     '''Decorator that reports the execution time.'''
   
@@ -23,38 +58,344 @@ def timeit(func):
         return result 
     return wrap 
 
-def redis_cache(module, expire=60, limit=None): 
+def wants_ndjson(accept_mimetypes):
+    '''Whether the client asked for a streamed application/x-ndjson response.'''
+    return accept_mimetypes.best == NDJSON_MIMETYPE
+
+def keyset_filter(query, after):
+    '''Restrict a query to the documents after the `after` cursor (keyset pagination on _id).'''
+    if after is None:
+        return query
+    if not query:
+        return {"_id": {"$gt": after}}
+    return {"$and": [query, {"_id": {"$gt": after}}]}
+
+# Query builders: they return the keyword arguments of find()/find_one(),
+# shared by the Flask and the ASGI handlers and by the query plan tests
+def by_id_find(id, projection=None):
+    return {"filter": {"_id": str(id)}, "projection": projection}
+
+def by_ids_find(ids, projection=None):
+    return {"filter": {"_id": {"$in": list(ids)}}, "projection": projection}
+
+def listing_find(after, projection=None, limit=None):
+    '''One keyset page of a collection in _id order, every document from `after` on without a limit.'''
+    return {"filter": keyset_filter({}, after), "projection": projection, "sort": [("_id", 1)], "limit": int(limit or 0)}
+
+def next_page_headers(base_url, args, items, limit):
+    '''Headers pointing to the next page, empty when this page is the last one.
+
+    Args:
+        base_url (str): URL of the endpoint without the query string.
+        args (dict): Query arguments of the current request.
+        items (list): Documents of the current page, sorted by _id.
+        limit (int): Page size.
+    '''
+    if not limit or len(items) < limit:
+        return {}
+    cursor = str(items[-1]['_id'])
+    query = urlencode({**args, 'after': cursor, 'limit': limit})
+    return {'X-Next-Cursor': cursor, 'Link': f'<{base_url}?{query}>; rel="next"'}
+
+def field_projection(fields, allowed):
+    '''Turn the comma separated `fields` query argument into a Mongo projection.
+
+    Args:
+        fields (str): Requested fields, e.g. "name,year,min_price". None or empty for every field.
+        allowed (tuple): Fields of the resource that may be requested.
+
+    Returns:
+        tuple: (projection, error). The projection always includes _id, its keys are
+            sorted so ','.join(projection) can be used in cache keys. It is None when
+            no fields were requested or the request is invalid.
+    '''
+    if not fields:
+        return None, None
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = sorted(requested - set(allowed))
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(allowed)}."
+    return {field: 1 for field in sorted(requested | {'_id'})}, None
+
+def ndjson_lines(docs, transform=None):
+    '''Serialize documents one per line as they come out of a cursor.'''
+    for doc in docs:
+        yield json.dumps(transform(doc) if transform else doc, default=str) + '\n'
+
+def stream_ndjson(docs, transform=None):
+    return Response(stream_with_context(ndjson_lines(docs, transform)), mimetype=NDJSON_MIMETYPE)
+
+def read_bulk_items():
+    '''Read the items of a bulk request, sent either as a JSON array or as NDJSON.
+
+    Returns:
+        tuple: (items, error), items is None when the body is invalid.
+    '''
+    if request.mimetype == NDJSON_MIMETYPE:
+        try:
+            items = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError as e:
+            return None, f"Invalid NDJSON body: {e}"
+    else:
+        items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        return None, "Invalid input. A non-empty JSON array or NDJSON body is required."
+    return items, None
+
+def bulk_write_batches(collection, operations, batch_size=BULK_BATCH_SIZE, session=None):
+    '''Run operations as unordered bulk writes of at most `batch_size` operations.
+
+    A failing operation does not stop the others, its error is reported in its result.
+
+    Args:
+        collection: The pymongo collection.
+        operations (list): pymongo write operations (UpdateOne, ReplaceOne...).
+        batch_size (int): Operations sent per bulk_write.
+
+    Returns:
+        list: One result per operation, {"status": "created"} for upserted documents,
+            {"status": "updated"} for existing ones or {"status": "failed", "error": ...}.
+    '''
+    results = []
+    for start in range(0, len(operations), batch_size):
+        batch = operations[start:start + batch_size]
+        try:
+            upserted = collection.bulk_write(batch, ordered=False, session=session).upserted_ids
+            errors = {}
+        except BulkWriteError as e:
+            upserted = {op['index']: op['_id'] for op in e.details.get('upserted', [])}
+            errors = {error['index']: error['errmsg'] for error in e.details.get('writeErrors', [])}
+        for i in range(len(batch)):
+            if i in errors:
+                results.append({'status': 'failed', 'error': errors[i]})
+            elif i in upserted:
+                results.append({'status': 'created'})
+            else:
+                results.append({'status': 'updated'})
+    return results
+
+def bulk_response(results):
+    '''Summarize per-item bulk results, they keep the order of the request items.'''
+    counts = {'created': 0, 'updated': 0, 'invalid': 0, 'failed': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return jsonify(counts | {'results': results}), 200
+
+def invalidate(*tags):
+    '''Invalidate every cached response tagged with any of the given tags.
+
+    Bumps one generation counter per tag, so stale redis entries are simply
+    never read again and expire on their own, and broadcasts the tags to the
+    other workers so they drop their local copies.
+
+    Args:
+        tags (str): Tags such as "part:<id>", "set:<id>", "parts" or "colors".
+    '''
+    if not tags:
+        return
+    pipe = REDIS.pipeline(transaction=False)
+    for tag in tags:
+        pipe.incr(f"cache:gen:{tag}")
+    pipe.publish(INVALIDATION_CHANNEL, json.dumps(tags))
+    pipe.execute()
+    LOCAL_CACHE.invalidate_tags(tags)
+    _run_invalidation_hooks(tags)
+
+def on_invalidate(tag, callback):
+    '''Call `callback` whenever `tag` is invalidated, by this worker or any other one.
+
+    Used by in-process caches that are not responses, e.g. the color registry.
+    '''
+    _invalidation_hooks.setdefault(tag, []).append(callback)
+
+def _run_invalidation_hooks(tags):
+    for tag in tags:
+        for callback in _invalidation_hooks.get(tag, ()):
+            callback()
+
+def _listen_for_invalidations():
+    while True:
+        try:
+            pubsub = REDIS.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                tags = json.loads(message['data'])
+                LOCAL_CACHE.invalidate_tags(tags)
+                _run_invalidation_hooks(tags)
+        except Exception as e:
+            print('Invalidation listener error:', e)
+        # Messages may have been missed while disconnected
+        LOCAL_CACHE.clear()
+        _run_invalidation_hooks(list(_invalidation_hooks))
+        time.sleep(1)
+
+def _start_invalidation_listener():
+    global _invalidation_listener
+    with _invalidation_lock:
+        if _invalidation_listener is None:
+            _invalidation_listener = threading.Thread(target=_listen_for_invalidations, daemon=True)
+            _invalidation_listener.start()
+
+def _read_cache_entry(query, entry_tags):
+    '''Fetch a cached entry, its TTL and the current tag generations in one round trip.'''
+    pipe = REDIS_CACHE.pipeline(transaction=False)
+    pipe.hgetall(query)
+    pipe.pttl(query)
+    if entry_tags:
+        pipe.mget([f"cache:gen:{tag}" for tag in entry_tags])
+    found, ttl, *gens = pipe.execute(raise_on_error=False)
+    return parse_cache_entry(found, gens[0] if gens else None) + (ttl,)
+
+def parse_cache_entry(found, gens):
+    '''Validate a raw cache hash against the current tag generations.
+
+    Returns:
+        tuple: (entry or None when missing or invalidated, current generation string)
+    '''
+    generation = '.'.join(g.decode() if g else '0' for g in gens) if gens else ''
+    if not isinstance(found, dict) or b'body' not in found or found.get(b'gen', b'').decode() != generation:
+        return None, generation
+    return {k.decode(): v for k, v in found.items()}, generation
+
+def cache_key(module, name, limit, args, kwargs):
+    query = f"requests:{module}:{name}:"
+    if limit:
+        query += str(limit)
+    for i, item in enumerate(kwargs):
+        if i != 0:
+            query += '-'
+        query += f"{kwargs[item]}"
+
+    for i, item in enumerate(args):
+        query += '-'
+        query += f"{item}"
+    return query
+
+def encode_cache_entry(body, content_type, status, headers=None):
+    '''Turn a response into the stored entry: final body bytes, compressed if large.'''
+    encoding = b''
+    if len(body) >= CACHE_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            body, encoding = compressed, b'zlib'
+    return {
+        'body': body,
+        'enc': encoding,
+        'ct': content_type.encode(),
+        'status': str(status).encode(),
+        'hdrs': json.dumps({name: headers[name] for name in CACHED_HEADERS if headers and name in headers}).encode(),
+    }
+
+def decode_cache_entry(entry, accepts_deflate):
+    '''Get the body and extra headers to send for a stored entry.
+
+    Compressed bodies are sent as-is with "Content-Encoding: deflate" to clients
+    that accept it and only inflated for the ones that do not.
+    '''
+    body = entry['body']
+    headers = json.loads(entry.get('hdrs') or b'{}')
+    if entry['enc'] == b'zlib':
+        headers['Vary'] = 'Accept-Encoding'
+        if accepts_deflate:
+            headers['Content-Encoding'] = 'deflate'
+        else:
+            body = zlib.decompress(body)
+    return body, headers
+
+def _cached_response(entry):
+    '''Build a response straight from the stored body bytes.'''
+    body, headers = decode_cache_entry(entry, 'deflate' in request.accept_encodings)
+    return Response(body, status=int(entry['status']), content_type=entry['ct'].decode(), headers=headers)
+
+def _acquire_cache_lock(query):
+    token = uuid.uuid4().hex
+    if REDIS.set(f"lock:{query}", token, nx=True, px=CACHE_LOCK_TIMEOUT):
+        return token
+    return None
+
+def release_lock(key, token):
+    '''Delete a redis lock only if it is still held with `token`, a lock that expired and was taken again is left alone.'''
+    _RELEASE_LOCK(keys=[key], args=[token])
+
+def _release_cache_lock(query, token):
+    release_lock(f"lock:{query}", token)
+
+def redis_cache(module, expire=60, limit=None, tags=(), stale=0): 
     '''Decorator that saves query result in redis.
+
+    Results are also kept in the in-process LOCAL_CACHE for the remaining
+    redis TTL, so repeated hits in the same worker skip the round trip.
+    Entries are stored together with the generations of their tags and are
+    treated as misses once any of those tags is invalidated. The stored value
+    is the final response body (zlib-compressed above CACHE_COMPRESS_MIN_BYTES)
+    with its content type and status, so hits are returned without re-encoding.
+
+    Recomputation is single-flight: a short redis lock per key lets one
+    request run the query while the others wait for its result, or, when
+    `stale` is set, keep serving the previous value until it is refreshed.
     
     Args:
         module (str): The module name.
-        expire (int): The expiration time in minutes.
+        expire (int): The expiration time in minutes (soft TTL when `stale` is set).
+        tags (tuple): Tag templates formatted with the call arguments, e.g. "part:{id}".
+        stale (int): Minutes an expired value may still be served while it is refreshed.
     '''
 
     def decorator(func):
+        signature = inspect.signature(func)
+
         def wrap(*args, **kwargs): 
-            query = f"requests:{module}:{func.__name__}:"
-            if limit:
-                query += str(limit)
-            for i, item in enumerate(kwargs):
-                if i != 0:
-                    query += '-'
-                query += f"{kwargs[item]}"
-            
-            for i, item in enumerate(args):
-                query += '-'
-                query += f"{item}"
-
-            if a:=REDIS.get(query):
-                return jsonify(a)
-        
-            result = func(*args, **kwargs)
-            if result[1] != 200:
-                print('Not caching error response...')
-                return result
-            print('Inserting into cache...')
-            REDIS.set(query, str(result[0].json), ex=expire*60)
-            return result
+            if _invalidation_listener is None:
+                _start_invalidation_listener()
+
+            query = cache_key(module, func.__name__, limit, args, kwargs)
+
+            if (a:=LOCAL_CACHE.get(query)) is not None:
+                LOCAL_CACHE.record(module, 'local_hits')
+                return _cached_response(a)
+
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            entry_tags = [tag.format(**arguments) for tag in tags]
+
+            found, generation, ttl = _read_cache_entry(query, entry_tags)
+            fresh_for = float(found.get('soft', 0)) - time.time() if found else 0
+            if found and fresh_for > 0:
+                LOCAL_CACHE.record(module, 'redis_hits')
+                LOCAL_CACHE.set(query, found, min(fresh_for, ttl / 1000, LOCAL_CACHE_MAX_TTL), size=len(found['body']), tags=entry_tags)
+                return _cached_response(found)
+
+            token = _acquire_cache_lock(query)
+            if token is None:
+                if found:
+                    # Someone else is refreshing, the stale value will do meanwhile
+                    LOCAL_CACHE.record(module, 'stale_hits')
+                    return _cached_response(found)
+                deadline = time.monotonic() + CACHE_LOCK_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    found, generation, _ = _read_cache_entry(query, entry_tags)
+                    if found:
+                        LOCAL_CACHE.record(module, 'redis_hits')
+                        return _cached_response(found)
+
+            LOCAL_CACHE.record(module, 'misses')
+            try:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    print('Not caching error response...')
+                    return response
+                print('Inserting into cache...')
+                entry = encode_cache_entry(response.get_data(), response.content_type, response.status_code, response.headers)
+                pipe = REDIS_CACHE.pipeline()
+                pipe.delete(query)
+                pipe.hset(query, mapping=entry | {'gen': generation, 'soft': time.time() + expire*60})
+                pipe.expire(query, (expire + stale)*60)
+                pipe.execute()
+                LOCAL_CACHE.set(query, entry, min(expire*60, LOCAL_CACHE_MAX_TTL), size=len(entry['body']), tags=entry_tags)
+                return response
+            finally:
+                if token:
+                    _release_cache_lock(query, token)
         wrap.__name__ = func.__name__
         return wrap
     return decorator
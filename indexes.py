@@ -0,0 +1,77 @@
+from imports import *
+from pymongo import IndexModel, ASCENDING
+import argparse
+
+# Indexes needed by the queries of every blueprint, per collection. Only
+# indexes a route query uses are declared, each one adds cost to every write.
+#
+#   python indexes.py [collection ...] [--dry-run]
+#
+# Building is idempotent: indexes that already exist with the same keys are
+# skipped, the missing ones are built one at a time so a replica set member
+# never has several builds running, and nothing is ever dropped.
+INDEXES = {
+    'set_overviews': [
+        # stats: sets with the most and the least parts
+        IndexModel([("num_parts", ASCENDING)], name="num_parts_1"),
+    ],
+    'parts': [
+        # /parts/colors/<color> once colors are stored as an array
+        IndexModel([("colors.color_id", ASCENDING)], name="colors.color_id_1"),
+    ],
+    'part_set_index': [
+        # /parts/<id>/sets?color=, set completion of inventories
+        IndexModel([("key", ASCENDING), ("quantity", ASCENDING)], name="key_1_quantity_1"),
+        # /parts/<id>/sets
+        IndexModel([("part_id", ASCENDING), ("quantity", ASCENDING)], name="part_id_1_quantity_1"),
+        # reindexing and deleting sets
+        IndexModel([("set_id", ASCENDING)], name="set_id_1"),
+    ],
+    'set_lsh': [
+        # candidate sets sharing an LSH band
+        IndexModel([("bands", ASCENDING)], name="bands_1"),
+    ],
+}
+
+def _keys(index):
+    # The server may report directions as floats
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in index['key'].items()]
+
+def ensure_indexes(collections=None, db=DB, dry_run=False):
+    """
+    Build the declared indexes that are missing.
+
+    Args:
+        collections (iterable): Collection names, every declared collection by default.
+        db: The database, the application one by default.
+        dry_run (bool): Only report the missing indexes.
+
+    Returns:
+        list: "<collection>.<index name>" of the indexes built (or missing on a dry run).
+    """
+    built = []
+    for name in collections or INDEXES:
+        collection = db[name]
+        existing = {index['name']: _keys(index) for index in collection.list_indexes()}
+        for model in INDEXES[name]:
+            document = model.document
+            keys = _keys(document)
+            if keys in existing.values():
+                continue
+            if document['name'] in existing:
+                print(f"{name}.{document['name']}: an index with this name but other keys exists, skipped")
+                continue
+            if not dry_run:
+                start = time.perf_counter()
+                collection.create_indexes([model])
+                print(f"{name}.{document['name']}: built in {time.perf_counter() - start:.1f}s")
+            built.append(f"{name}.{document['name']}")
+    return built
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the indexes the API queries need.')
+    parser.add_argument('collections', nargs='*', help='Collections to index, all of them by default')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the missing indexes')
+    args = parser.parse_args()
+    missing = ensure_indexes(args.collections, dry_run=args.dry_run)
+    print(f"{len(missing)} index(es) {'missing' if args.dry_run else 'built'}")
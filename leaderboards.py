@@ -0,0 +1,179 @@
+from imports import *
+import argparse
+
+# Set rankings kept as Redis sorted sets, updated whenever a set's price or
+# offers change, so the leaderboard routes read the top k members instead of
+# sorting every overview
+#
+#   python leaderboards.py rebuild
+#
+# Until a first rebuild (loader, CLI or application startup) has finished the
+# routes answer 503 rather than sorting the whole catalog on a request.
+SET_OVERVIEWS_COLLECTION = DB['set_overviews']
+LEADERBOARDS_BUILT_KEY = 'sets:leaderboards:built'
+LEADERBOARDS_REBUILD_LOCK = 'lock:sets:leaderboards:rebuild'
+LEADERBOARD_BATCH_SIZE = int(os.getenv('LEADERBOARD_BATCH_SIZE', 1000))
+# Seconds a rebuild may take before another one is allowed to start
+LEADERBOARD_REBUILD_TIMEOUT = int(os.getenv('LEADERBOARD_REBUILD_TIMEOUT', 600))
+
+# Sets ranked while a rebuild runs are remembered under the rebuild's token
+# and ranked again once the rebuilt boards are in place
+_MARK_DIRTY = REDIS.register_script("""
+local token = redis.call('get', KEYS[1])
+if token then
+    local key = ARGV[1] .. token
+    for i = 3, #ARGV do redis.call('sadd', key, ARGV[i]) end
+    redis.call('expire', key, ARGV[2])
+end
+""")
+DIRTY_PREFIX = 'sets:leaderboards:dirty:'
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def _profit(overview):
+    price, min_offer = _number(overview.get('price')), _number(overview.get('min_offer'))
+    return price - min_offer if price is not None and min_offer is not None else None
+
+# Board name -> (key, score of an overview, best first when descending)
+LEADERBOARDS = {
+    'cheapest_new': ('sets:cheapest:new', lambda overview: _number(overview.get('price')), False),
+    'cheapest_used': ('sets:cheapest:used', lambda overview: _number(overview.get('min_offer')), False),
+    'profitable': ('sets:profitable', _profit, True),
+}
+RANKED_FIELDS = {"price": 1, "min_offer": 1}
+
+def _queue_rankings(pipe, overview, prefix=''):
+    for key, score_of, _ in LEADERBOARDS.values():
+        score = score_of(overview)
+        if score is None:
+            pipe.zrem(prefix + key, overview['_id'])
+        else:
+            pipe.zadd(prefix + key, {overview['_id']: score})
+
+def rank_sets(overviews):
+    """
+    Update the leaderboards for set overviews, with one pipelined round trip.
+
+    Args:
+        overviews (iterable): Overviews with at least _id, price and min_offer.
+            A set without a price (or offers) leaves the boards that need them.
+    """
+    overviews = list(overviews)
+    if not overviews:
+        return
+    pipe = REDIS.pipeline(transaction=False)
+    for overview in overviews:
+        _queue_rankings(pipe, overview)
+    _mark_dirty(pipe, [overview['_id'] for overview in overviews])
+    pipe.execute()
+
+def _mark_dirty(pipe, set_ids):
+    _MARK_DIRTY(keys=[LEADERBOARDS_REBUILD_LOCK], args=[DIRTY_PREFIX, LEADERBOARD_REBUILD_TIMEOUT, *set_ids], client=pipe)
+
+def rank_set_ids(set_ids):
+    """Re-rank sets from their stored overviews, read with one $in query. Sets that no longer exist are unranked."""
+    set_ids = [str(set_id) for set_id in set_ids]
+    if not set_ids:
+        return
+    overviews = list(SET_OVERVIEWS_COLLECTION.find({"_id": {"$in": set_ids}}, RANKED_FIELDS))
+    found = {overview['_id'] for overview in overviews}
+    rank_sets(overviews + [{"_id": set_id} for set_id in set_ids if set_id not in found])
+
+def unrank_set(set_id):
+    rank_sets([{"_id": str(set_id)}])
+
+def leaderboards_built():
+    return bool(REDIS.exists(LEADERBOARDS_BUILT_KEY))
+
+def rebuild_leaderboards(batch_size=LEADERBOARD_BATCH_SIZE):
+    """
+    Rank every set overview into fresh keys, then swap them in at once.
+
+    Only one rebuild runs at a time. Sets ranked during the rebuild are
+    ranked again from their overviews after the swap, so those writes are
+    not lost to boards scanned before them.
+
+    Returns:
+        bool: False when another rebuild is already running.
+    """
+    token = uuid.uuid4().hex
+    if not REDIS.set(LEADERBOARDS_REBUILD_LOCK, token, nx=True, ex=LEADERBOARD_REBUILD_TIMEOUT):
+        print('A leaderboard rebuild is already running')
+        return False
+    prefix = f'rebuild:{token}:'
+    try:
+        pipe = REDIS.pipeline(transaction=False)
+        ranked = 0
+        for overview in SET_OVERVIEWS_COLLECTION.find({}, RANKED_FIELDS).batch_size(batch_size):
+            _queue_rankings(pipe, overview, prefix)
+            ranked += 1
+            if ranked % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+
+        pipe = REDIS.pipeline()
+        for key, _, _ in LEADERBOARDS.values():
+            # RENAME fails on a board that ended up empty
+            pipe.delete(key)
+            pipe.eval("if redis.call('exists', KEYS[1]) == 1 then return redis.call('rename', KEYS[1], KEYS[2]) end", 2, prefix + key, key)
+        pipe.set(LEADERBOARDS_BUILT_KEY, int(time.time()))
+        pipe.execute()
+
+        dirty = REDIS.smembers(DIRTY_PREFIX + token)
+        rank_set_ids(dirty)
+        print(f'Ranked {ranked} sets, {len(dirty)} ranked again after concurrent writes')
+        return True
+    finally:
+        REDIS.delete(*(prefix + key for key, _, _ in LEADERBOARDS.values()), DIRTY_PREFIX + token)
+        release_lock(LEADERBOARDS_REBUILD_LOCK, token)
+
+def parse_count(x):
+    """The number of sets asked for by a leaderboard route, None unless a positive integer."""
+    try:
+        count = int(x)
+    except (TypeError, ValueError):
+        return None
+    return count if count >= 1 else None
+
+def ranking_range(board, count):
+    """ZRANGE arguments of the top `count` sets of a leaderboard."""
+    key, _, descending = LEADERBOARDS[board]
+    return key, 0, count - 1, descending
+
+def order_overviews(set_ids, overviews):
+    """Overviews in the order of the ranked ids, skipping sets deleted meanwhile."""
+    overviews = {overview['_id']: overview for overview in overviews}
+    return [overviews[set_id] for set_id in set_ids if set_id in overviews]
+
+def ranked_overviews(board, count):
+    """
+    The overviews of the top `count` sets of a leaderboard, in rank order.
+
+    Returns:
+        list: The overviews, None while the leaderboards were never built.
+    """
+    if not leaderboards_built():
+        return None
+    key, start, end, descending = ranking_range(board, count)
+    set_ids = REDIS.zrange(key, start, end, desc=descending)
+    return order_overviews(set_ids, SET_OVERVIEWS_COLLECTION.find(**by_ids_find(set_ids)))
+
+INVALID_COUNT_ERROR = 'Invalid count. Must be a positive integer.'
+NOT_BUILT_ERROR = 'Leaderboards are not built yet, run `python leaderboards.py rebuild`.'
+
+def leaderboard_response(count, overviews):
+    """Body and status of a leaderboard route from parse_count and ranked_overviews."""
+    if count is None:
+        return {'error': INVALID_COUNT_ERROR}, 400
+    if overviews is None:
+        return {'error': NOT_BUILT_ERROR}, 503
+    return overviews, 200
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the set leaderboards.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help='Rank every set overview again')
+    rebuild_parser.add_argument('--batch-size', type=int, default=LEADERBOARD_BATCH_SIZE)
+    args = parser.parse_args()
+    rebuild_leaderboards(args.batch_size)
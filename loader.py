@@ -0,0 +1,204 @@
+from imports import *
+from pymongo import UpdateOne, ReplaceOne
+from multiprocessing import Pool
+from itertools import islice
+from price_summary import summarize_part
+from part_colors import PARTS_COLORS_LAYOUT, add_colors_expression
+from stats import refresh_statistics
+import argparse
+import csv
+import gzip
+import part_index
+import similarity
+import leaderboards
+
+# Offline loader for Rebrickable CSV dumps (colors, sets, parts, inventories, inventory_parts)
+#
+#   python loader.py path/to/dump --batch-size 1000 --workers 4
+#
+# Every file may also be gzipped (sets.csv.gz...), as they are downloaded.
+COLORS_COLLECTION = DB['colors']
+PARTS_COLLECTION = DB['parts']
+SET_OVERVIEWS_COLLECTION = DB['set_overviews']
+SET_CONTENTS_COLLECTION = DB['set_contents']
+SET_OFFERS_COLLECTION = DB['set_offers']
+
+def open_csv(directory, name):
+    """Stream the rows of <name>.csv or <name>.csv.gz as dicts."""
+    path = os.path.join(directory, f'{name}.csv')
+    if os.path.exists(path):
+        handle = open(path, newline='', encoding='utf-8')
+    else:
+        handle = gzip.open(path + '.gz', 'rt', newline='', encoding='utf-8')
+    with handle:
+        yield from csv.DictReader(handle)
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+class Progress:
+    """Prints how many rows of a file went through and at which rate."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def add(self, count):
+        self.count += count
+        elapsed = time.perf_counter() - self.start
+        print(f'\r{self.name}: {self.count} rows ({self.count / max(elapsed, 1e-9):.0f} rows/s)', end='', flush=True)
+
+    def done(self):
+        elapsed = time.perf_counter() - self.start
+        print(f'\r{self.name}: {self.count} rows in {elapsed:.1f}s ({self.count / max(elapsed, 1e-9):.0f} rows/s)')
+
+# Transforms, run in the worker pool on chunks of CSV rows
+
+def transform_colors(rows):
+    return [
+        {"_id": int(row['id']), "name": row['name'], "rgb": row['rgb'], "is_trans": row['is_trans']}
+        for row in rows if int(row['id']) >= 0
+    ]
+
+def transform_sets(rows):
+    return [
+        {"_id": row['set_num'], "name": row['name'], "year": int(row['year']), "num_parts": int(row['num_parts'])}
+        for row in rows
+    ]
+
+def transform_parts(rows):
+    return [row['part_num'] for row in rows]
+
+_inventory_sets = {}
+
+def _init_inventory_worker(inventory_sets):
+    global _inventory_sets
+    _inventory_sets = inventory_sets
+
+def transform_inventory_parts(rows):
+    """(set_id, part_id, color, quantity) of the non-spare parts of the latest set inventories."""
+    entries = []
+    for row in rows:
+        set_id = _inventory_sets.get(row['inventory_id'])
+        if set_id is None or row.get('is_spare') == 't':
+            continue
+        entries.append((set_id, row['part_num'], row['color_id'], int(row['quantity'])))
+    return entries
+
+# Writers
+
+def write_batches(collection, operations, batch_size):
+    for start in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[start:start + batch_size], ordered=False)
+
+def load_colors(pool, directory, batch_size):
+    progress = Progress('colors')
+    for colors in pool.imap(transform_colors, chunks(open_csv(directory, 'colors'), batch_size)):
+        write_batches(COLORS_COLLECTION, [ReplaceOne({"_id": color['_id']}, color, upsert=True) for color in colors], batch_size)
+        pipe = REDIS.pipeline(transaction=False)
+        for color in colors:
+            pipe.hset(f"colors:{color['_id']}", mapping=color)
+        pipe.execute()
+        progress.add(len(colors))
+    progress.done()
+
+def load_sets(pool, directory, batch_size):
+    progress = Progress('sets')
+    for overviews in pool.imap(transform_sets, chunks(open_csv(directory, 'sets'), batch_size)):
+        write_batches(SET_OVERVIEWS_COLLECTION, [
+            UpdateOne({"_id": overview['_id']}, {"$set": overview}, upsert=True) for overview in overviews
+        ], batch_size)
+        write_batches(SET_OFFERS_COLLECTION, [
+            UpdateOne({"_id": overview['_id']}, {"$setOnInsert": {"offers": []}}, upsert=True) for overview in overviews
+        ], batch_size)
+        progress.add(len(overviews))
+    progress.done()
+
+def latest_inventories(directory):
+    """{inventory_id: set_id} keeping only the latest inventory version of every set."""
+    latest = {}
+    for row in open_csv(directory, 'inventories'):
+        version = int(row['version'])
+        if row['set_num'] not in latest or version > latest[row['set_num']][0]:
+            latest[row['set_num']] = (version, row['id'])
+    return {inventory_id: set_id for set_id, (_, inventory_id) in latest.items()}
+
+def load_contents(directory, batch_size, workers):
+    """
+    Join inventory_parts with the set inventories into set_contents.
+
+    Returns:
+        dict: {part_id: set of color ids} of every part used in a set.
+    """
+    contents = {}
+    part_colors = {}
+    progress = Progress('inventory_parts')
+    with Pool(workers, initializer=_init_inventory_worker, initargs=(latest_inventories(directory),)) as pool:
+        for entries in pool.imap(transform_inventory_parts, chunks(open_csv(directory, 'inventory_parts'), batch_size)):
+            for set_id, part_id, color, quantity in entries:
+                set_parts = contents.setdefault(set_id, {}).setdefault(part_id, {})
+                set_parts[color] = set_parts.get(color, 0) + quantity
+                part_colors.setdefault(part_id, set()).add(color)
+            progress.add(len(entries))
+    progress.done()
+
+    # set_contents holds one color per part, the one the set uses most of
+    progress = Progress('set_contents')
+    operations = []
+    for set_id, set_parts in contents.items():
+        parts = {}
+        for part_id, colors in set_parts.items():
+            color, quantity = max(colors.items(), key=lambda item: item[1])
+            parts[part_id] = {"color": color, "quantity": quantity}
+        operations.append(ReplaceOne({"_id": set_id}, {"_id": set_id, "parts": parts}, upsert=True))
+        if len(operations) >= batch_size:
+            write_batches(SET_CONTENTS_COLLECTION, operations, batch_size)
+            progress.add(len(operations))
+            operations = []
+    write_batches(SET_CONTENTS_COLLECTION, operations, batch_size)
+    progress.add(len(operations))
+    progress.done()
+    return part_colors
+
+def part_operation(part_id, colors, layout=PARTS_COLORS_LAYOUT):
+    # Colors are added without offers, the offers and summary of existing parts are kept
+    new_colors = {color: [] for color in sorted(colors)}
+    return UpdateOne({"_id": part_id}, [{"$set": {
+        "colors": add_colors_expression(new_colors, layout),
+        "price_summary": {"$ifNull": ["$price_summary", summarize_part(new_colors)]},
+    }}], upsert=True)
+
+def load_parts(pool, directory, batch_size, part_colors):
+    progress = Progress('parts')
+    for part_ids in pool.imap(transform_parts, chunks(open_csv(directory, 'parts'), batch_size)):
+        write_batches(PARTS_COLLECTION, [part_operation(part_id, part_colors.get(part_id, ())) for part_id in part_ids], batch_size)
+        progress.add(len(part_ids))
+    progress.done()
+
+def load(directory, batch_size=1000, workers=None):
+    """Load a whole dump, then rebuild the part index, the set similarity bands and the statistics."""
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        load_colors(pool, directory, batch_size)
+        load_sets(pool, directory, batch_size)
+    part_colors = load_contents(directory, batch_size, workers)
+    with Pool(workers) as pool:
+        load_parts(pool, directory, batch_size, part_colors)
+
+    part_index.rebuild_index(batch_size)
+    similarity.rebuild_index(batch_size)
+    leaderboards.rebuild_leaderboards(batch_size)
+    refresh_statistics()
+    invalidate('colors', 'parts', 'parts:offers', 'sets')
+    print(f'Loaded {directory} in {time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load a Rebrickable CSV dump into the bricks database.')
+    parser.add_argument('directory', help='Directory with colors, sets, parts, inventories and inventory_parts CSV files')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transform chunk and operations per bulk write')
+    parser.add_argument('--workers', type=int, default=None, help='Transform processes, defaults to the CPU count')
+    args = parser.parse_args()
+    load(args.directory, args.batch_size, args.workers)
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+class LocalCache:
+    '''Bounded, thread-safe in-process LRU cache with per-entry expiry.
+
+    Used as the first tier in front of Redis, so every worker keeps its own copy
+    of the hottest responses and serves them without any I/O.
+
+    Args:
+        max_entries (int): Maximum number of entries kept.
+        max_bytes (int): Maximum total size of the stored values in bytes.
+    '''
+
+    def __init__(self, max_entries=2048, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, tags)
+        self._tags = defaultdict(set)  # tag -> keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'local_hits': 0, 'redis_hits': 0, 'stale_hits': 0, 'misses': 0})
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def get(self, key):
+        '''Return the cached value or None if it is missing or expired.'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl, size=None, tags=()):
+        '''Store a value for `ttl` seconds, evicting least recently used entries.
+
+        Args:
+            key (str): Cache key.
+            value: Value to store.
+            ttl (float): Time to live in seconds.
+            size (int): Size of the value in bytes, defaults to len(value).
+            tags (iterable): Tags the entry can later be invalidated by.
+        '''
+        if size is None:
+            size = len(value)
+        if ttl <= 0 or size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            tags = tuple(tags)
+            self._entries[key] = (value, size, time.monotonic() + ttl, tags)
+            for tag in tags:
+                self._tags[tag].add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_tags(self, tags):
+        '''Drop every entry stored with any of the given tags.'''
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _, tags = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def record(self, module, outcome):
+        '''Count a lookup outcome ('local_hits', 'redis_hits', 'stale_hits' or 'misses') for a module.'''
+        with self._lock:
+            self._stats[module][outcome] += 1
+
+    def stats(self):
+        '''Return per-module hit and miss counts together with the cache occupancy.'''
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'modules': {module: dict(counts) for module, counts in self._stats.items()},
+            }
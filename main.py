@@ -2,7 +2,9 @@ from user import users_api
 from parts import parts_api
 from colors import colors_api
 from sets import sets_api
-from stats import stats_api
+from stats import stats_api, start_stats_refresher
+from indexes import ensure_indexes
+from leaderboards import leaderboards_built, rebuild_leaderboards
 from imports import *
 
 app = Flask(__name__)
@@ -11,11 +13,23 @@ app.register_blueprint(parts_api, url_prefix='/parts')
 app.register_blueprint(colors_api, url_prefix='/colors')
 app.register_blueprint(sets_api, url_prefix='/sets')
 app.register_blueprint(stats_api, url_prefix='/stats')
+start_stats_refresher()
+# Missing indexes are built before serving, existing ones are left untouched
+if os.getenv('ENSURE_INDEXES_ON_STARTUP', '1') == '1':
+    ensure_indexes()
+# Leaderboards never built are ranked in the background, the rebuild lock
+# keeps the workers from doing it more than once
+if os.getenv('REBUILD_LEADERBOARDS_ON_STARTUP', '1') == '1' and not leaderboards_built():
+    threading.Thread(target=rebuild_leaderboards, daemon=True).start()
 
 @app.route('/')
 def index():
     return "Welcome to Brickscrapper"
 
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(LOCAL_CACHE.stats()), 200
+
 # SETS
 @app.route('/sets')
 def get_sets():
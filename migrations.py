@@ -0,0 +1,215 @@
+from imports import *
+from pymongo import UpdateOne
+from price_summary import summarize_part
+from part_colors import colors_array_expression, IS_OBJECT_LAYOUT
+import argparse
+
+# Resumable data migrations
+#
+#   python migrations.py list
+#   python migrations.py run [name ...] [--batch-size N] [--rate DOCS_PER_SECOND] [--dry-run] [--restart]
+#
+# A migration walks one collection in _id order, a batch at a time, and turns
+# documents into updates that are sent with one unordered bulk_write per batch.
+# The last _id of every written batch is checkpointed in the migrations
+# collection, so an interrupted run resumes where it stopped.
+MIGRATIONS_COLLECTION = DB['migrations']
+PARTS_COLLECTION = DB['parts']
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 500))
+# Documents per second, 0 for no limit
+MIGRATION_RATE = float(os.getenv('MIGRATION_RATE', 0))
+
+MIGRATIONS = {}
+
+def migration(name, collection, query=None, projection=None, prepare=None, guard=None, tags=()):
+    """
+    Register a migration, applied in name order.
+
+    Args:
+        name (str): Unique name, prefixed with a sequence number, e.g. "0001_color_names_to_ids".
+        collection: The collection to migrate.
+        query (dict): Only documents matching it are visited.
+        projection (dict): Fields the update function needs.
+        prepare (callable): Called once per run, its result is passed to every update call.
+        guard (dict): Added to the filter of every update, so the server checks
+            it again at write time, when documents may have changed since read.
+        tags (tuple): Cache tags invalidated after every written batch, "{id}"
+            is replaced by the _id of each updated document, e.g. "part:{id}".
+
+    The decorated function takes (document, context) and returns an update
+    document, or None when the document needs no change.
+    """
+    def decorator(func):
+        MIGRATIONS[name] = {
+            'collection': collection,
+            'query': query or {},
+            'projection': projection,
+            'prepare': prepare,
+            'guard': guard or {},
+            'tags': tags,
+            'update': func,
+        }
+        return func
+    return decorator
+
+def run_migration(name, batch_size=MIGRATION_BATCH_SIZE, rate=MIGRATION_RATE, dry_run=False, restart=False):
+    """
+    Run one migration from its checkpoint.
+
+    Args:
+        name (str): Registered migration name.
+        batch_size (int): Documents read and updates written per round trip.
+        rate (float): Maximum documents per second, 0 for no limit.
+        dry_run (bool): Only count what would be updated, nothing is written or checkpointed.
+        restart (bool): Ignore the checkpoint and start from the first document.
+    """
+    spec = MIGRATIONS[name]
+    state = {} if restart else MIGRATIONS_COLLECTION.find_one({"_id": name}) or {}
+    if state.get('status') == 'done':
+        print(f'{name}: already done')
+        return
+
+    collection = spec['collection']
+    context = spec['prepare']() if spec['prepare'] else None
+    last_id = state.get('last_id')
+    scanned = state.get('scanned', 0)
+    updated = state.get('updated', 0)
+    total = collection.estimated_document_count()
+    start = time.perf_counter()
+    run_scanned = 0
+
+    while True:
+        batch_start = time.perf_counter()
+        documents = list(
+            collection.find(keyset_filter(spec['query'], last_id), spec['projection']).sort('_id', 1).limit(batch_size)
+        )
+        if not documents:
+            break
+
+        operations = []
+        updated_ids = []
+        for document in documents:
+            update = spec['update'](document, context)
+            if update:
+                operations.append(UpdateOne({"_id": document['_id']} | spec['guard'], update))
+                updated_ids.append(document['_id'])
+        written = len(operations)
+        if operations and not dry_run:
+            written = collection.bulk_write(operations, ordered=False).modified_count
+            # Cached responses still have the documents' old shape
+            invalidate(*{tag.format(id=document_id) for tag in spec['tags'] for document_id in updated_ids})
+
+        last_id = documents[-1]['_id']
+        scanned += len(documents)
+        updated += written
+        run_scanned += len(documents)
+        if not dry_run:
+            MIGRATIONS_COLLECTION.update_one({"_id": name}, {"$set": {
+                "last_id": last_id, "scanned": scanned, "updated": updated, "status": "running", "updated_at": time.time()
+            }}, upsert=True)
+
+        elapsed = time.perf_counter() - start
+        print(f'\r{name}: {scanned}/{total} scanned, {updated} {"to update" if dry_run else "updated"} '
+              f'({run_scanned / max(elapsed, 1e-9):.0f} docs/s)', end='', flush=True)
+
+        # Keep the batch from taking less than its share of the rate budget
+        if rate:
+            time.sleep(max(0, len(documents) / rate - (time.perf_counter() - batch_start)))
+
+    print()
+    if not dry_run:
+        MIGRATIONS_COLLECTION.update_one({"_id": name}, {"$set": {
+            "last_id": last_id, "scanned": scanned, "updated": updated, "status": "done", "updated_at": time.time()
+        }}, upsert=True)
+    print(f'{name}: {"dry run finished" if dry_run else "done"}, {scanned} scanned, {updated} {"to update" if dry_run else "updated"}')
+
+def run(names=None, **options):
+    """Run the given migrations, or every registered one, in name order."""
+    for name in sorted(names or MIGRATIONS):
+        run_migration(name, **options)
+
+def list_migrations():
+    states = {state['_id']: state for state in MIGRATIONS_COLLECTION.find({"_id": {"$in": list(MIGRATIONS)}})}
+    for name in sorted(MIGRATIONS):
+        state = states.get(name, {})
+        print(f"{name}: {state.get('status', 'pending')} ({state.get('scanned', 0)} scanned, {state.get('updated', 0)} updated)")
+
+# Migrations
+
+def color_name_map():
+    """
+    {lowercase color name: color id} and the set of ids, read from the colors:<id>
+    hashes and from the older colors:<id>:name strings.
+    """
+    keys = list(REDIS.scan_iter('colors:*'))
+    pipe = REDIS.pipeline(transaction=False)
+    for key in keys:
+        if key.endswith(':name'):
+            pipe.get(key)
+        else:
+            pipe.hget(key, 'name')
+    names = {name.lower(): key.split(':')[1] for key, name in zip(keys, pipe.execute()) if name}
+    return names, {key.split(':')[1] for key in keys}
+
+def map_colors_to_id(colors, names, color_ids):
+    """
+    Replace color names by color ids in a part's colors, dropping unknown colors.
+
+    Ids are kept as they are, so running the remap again changes nothing.
+
+    Args:
+        colors (dict | list): {color: offers} or a list of color names / {"color_name": ...} dicts.
+    """
+    def to_id(color):
+        return color if color in color_ids else names.get(str(color).lower())
+
+    if isinstance(colors, dict):
+        return {to_id(color): offers for color, offers in colors.items() if to_id(color)}
+
+    mapped = []
+    for color_data in colors:
+        if isinstance(color_data, dict):
+            color_id = to_id(color_data.get("color_id") or color_data.get("color_name"))
+            if color_id:
+                mapped.append(color_data | {"color_id": color_id})
+        elif isinstance(color_data, str) and to_id(color_data):
+            mapped.append({"color_id": to_id(color_data)})
+    return mapped
+
+@migration('0001_color_names_to_ids', PARTS_COLLECTION, query={"colors": {"$exists": True}}, projection={"colors": 1}, prepare=color_name_map,
+           tags=('part:{id}', 'parts', 'parts:offers'))
+def color_names_to_ids(part, context):
+    names, color_ids = context
+    colors = map_colors_to_id(part['colors'], names, color_ids)
+    # Parts without a single known color are left alone
+    if not colors or colors == part['colors']:
+        return None
+    update = {"colors": colors}
+    if isinstance(colors, dict):
+        update["price_summary"] = summarize_part(colors)
+    return {"$set": update}
+
+@migration('0002_colors_to_array', PARTS_COLLECTION, query={"$expr": IS_OBJECT_LAYOUT}, projection={"_id": 1}, guard={"$expr": IS_OBJECT_LAYOUT},
+           tags=('part:{id}', 'parts', 'parts:offers'))
+def colors_to_array(part, context):
+    # Run with PARTS_COLORS_LAYOUT=migrating. The conversion happens on the
+    # server from the colors stored at write time, so offers added meanwhile
+    # are kept and parts converted meanwhile are skipped.
+    return [{"$set": {"colors": colors_array_expression()}}]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run resumable data migrations.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='Show the registered migrations and their progress')
+    run_parser = subparsers.add_parser('run', help='Run migrations from their checkpoints')
+    run_parser.add_argument('names', nargs='*', help='Migrations to run, all of them by default')
+    run_parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    run_parser.add_argument('--rate', type=float, default=MIGRATION_RATE, help='Maximum documents per second, 0 for no limit')
+    run_parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+    run_parser.add_argument('--restart', action='store_true', help='Ignore checkpoints and start over')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        list_migrations()
+    else:
+        run(args.names, batch_size=args.batch_size, rate=args.rate, dry_run=args.dry_run, restart=args.restart)
@@ -0,0 +1,50 @@
+import hashlib
+import random
+
+# 64 hash functions split into 16 bands of 4 rows: sets with a Jaccard
+# similarity of about 0.5 share at least one band with high probability
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+def set_tokens(parts):
+    """
+    Turn set contents into the tokens of their (part, color) multiset.
+
+    Args:
+        parts (dict): {part_id: {"color": ..., "quantity": ...}}
+
+    Returns:
+        list: One token per brick, e.g. "3001|4|0", "3001|4|1".
+    """
+    return [
+        f"{part_id}|{part['color']}|{i}"
+        for part_id, part in parts.items()
+        for i in range(int(part.get('quantity', 1)))
+    ]
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=4).digest(), 'little')
+
+def signature(tokens):
+    """Compute the MinHash signature of a collection of tokens."""
+    hashes = {_token_hash(token) for token in tokens}
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    return [min((a * h + b) % _PRIME & _MAX_HASH for h in hashes) for a, b in _PERMUTATIONS]
+
+def bands(sig):
+    """Split a signature into LSH band keys, sets sharing any key are candidates."""
+    return [
+        f"{band}:{hashlib.blake2b(repr(sig[band * ROWS:(band + 1) * ROWS]).encode(), digest_size=8).hexdigest()}"
+        for band in range(BANDS)
+    ]
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimate the Jaccard similarity of two sets from their signatures."""
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / NUM_PERM
@@ -0,0 +1,145 @@
+import os
+
+# Storage layout of part colors:
+#   object     {"colors": {"4": [offers]}}, the original layout
+#   migrating  new writes use the array layout, reads accept both
+#   array      {"colors": [{"color_id": "4", "offers": [offers]}]}, served by
+#              the multikey index on colors.color_id
+# The API always exposes colors as {color_id: [offers]}. Switch to 'migrating',
+# run migration 0002_colors_to_array, then switch to 'array'.
+PARTS_COLORS_LAYOUT = os.getenv('PARTS_COLORS_LAYOUT', 'object')
+# Expression true for parts whose colors are still stored as an object, the
+# query $type operator would also match arrays of objects
+IS_OBJECT_LAYOUT = {"$eq": [{"$type": "$colors"}, "object"]}
+
+def colors_to_dict(colors):
+    """Read part colors stored in either layout as {color_id: offers}."""
+    if isinstance(colors, list):
+        return {str(color['color_id']): color.get('offers', []) for color in colors if isinstance(color, dict) and 'color_id' in color}
+    return colors or {}
+
+def colors_for_storage(colors, layout=PARTS_COLORS_LAYOUT):
+    """Turn {color_id: offers} into the stored layout."""
+    colors = colors_to_dict(colors)
+    if layout == 'object':
+        return colors
+    return [{"color_id": str(color_id), "offers": offers} for color_id, offers in colors.items()]
+
+def color_ids_expression():
+    """Aggregation expression for the color ids of a part in either layout."""
+    return {"$cond": [
+        {"$isArray": "$colors"},
+        "$colors.color_id",
+        {"$map": {"input": {"$objectToArray": {"$ifNull": ["$colors", {}]}}, "in": "$$this.k"}},
+    ]}
+
+def has_color_filter(color_id, layout=PARTS_COLORS_LAYOUT):
+    """Query matching the parts that have a color."""
+    color_id = str(color_id)
+    if layout == 'object':
+        return {f"colors.{color_id}": {"$exists": True}}
+    if layout == 'array':
+        return {"colors.color_id": color_id}
+    # On an array, colors.<n> would match the n-th element
+    return {"$or": [
+        {"colors.color_id": color_id},
+        {"$expr": IS_OBJECT_LAYOUT, f"colors.{color_id}": {"$exists": True}},
+    ]}
+
+def only_color_expression(color_id):
+    """Aggregation expression keeping a single color of a part, in the layout it is stored in."""
+    color_id = str(color_id)
+    return {"$cond": [
+        {"$isArray": "$colors"},
+        {"$filter": {"input": "$colors", "cond": {"$eq": ["$$this.color_id", color_id]}}},
+        {"$arrayToObject": {"$filter": {
+            "input": {"$objectToArray": {"$ifNull": ["$colors", {}]}},
+            "cond": {"$eq": ["$$this.k", color_id]},
+        }}},
+    ]}
+
+def parts_by_color_pipeline(color_id, limit, layout=PARTS_COLORS_LAYOUT):
+    """Parts having a color, with only that color's offers."""
+    if layout == 'object':
+        project = {"colors": {str(color_id): 1}}
+    else:
+        project = {"colors": only_color_expression(color_id)}
+    return [
+        {"$match": has_color_filter(color_id, layout)},
+        {"$project": project},
+        {"$limit": int(limit)},
+    ]
+
+def colors_array_expression():
+    """Aggregation expression for the stored colors as [{"color_id", "offers"}] whatever the layout."""
+    return {"$cond": [
+        {"$isArray": "$colors"},
+        "$colors",
+        {"$map": {"input": {"$objectToArray": {"$ifNull": ["$colors", {}]}}, "in": {"color_id": "$$this.k", "offers": "$$this.v"}}},
+    ]}
+
+def add_colors_expression(color_ids, layout=PARTS_COLORS_LAYOUT):
+    """
+    Aggregation expression for the colors of a part with empty offer lists
+    added for the missing `color_ids`, existing offers are kept.
+
+    Outside the object layout the result is always an array, so parts still
+    stored as objects are converted on the way.
+    """
+    color_ids = [str(color_id) for color_id in color_ids]
+    if layout == 'object':
+        return {"$mergeObjects": [{color_id: [] for color_id in color_ids}, {"$ifNull": ["$colors", {}]}]}
+    existing = colors_array_expression()
+    missing = {"$filter": {
+        "input": [{"color_id": color_id, "offers": []} for color_id in color_ids],
+        "cond": {"$not": [{"$in": ["$$this.color_id", {"$map": {"input": existing, "in": "$$this.color_id"}}]}]},
+    }}
+    return {"$concatArrays": [existing, missing]}
+
+def remove_colors_expression(color_ids):
+    """Aggregation expression for the colors of a part without `color_ids`, in the layout they are stored in."""
+    color_ids = [str(color_id) for color_id in color_ids]
+    return {"$cond": [
+        {"$isArray": "$colors"},
+        {"$filter": {"input": "$colors", "cond": {"$not": [{"$in": ["$$this.color_id", color_ids]}]}}},
+        {"$arrayToObject": {"$filter": {
+            "input": {"$objectToArray": {"$ifNull": ["$colors", {}]}},
+            "cond": {"$not": [{"$in": ["$$this.k", color_ids]}]},
+        }}},
+    ]}
+
+def push_offers_update(colors, layout=PARTS_COLORS_LAYOUT):
+    """
+    Update appending offers to colors, keeping every offer list sorted by price.
+
+    Args:
+        colors (dict): {color_id: [offers]}, the colors must exist outside the object layout.
+
+    Returns:
+        tuple: (update, array_filters), array_filters is None in the object layout.
+    """
+    def push(offers):
+        return {"$each": offers, "$sort": {"Price": 1}}
+    if layout == 'object':
+        return {"$push": {f"colors.{color_id}": push(offers) for color_id, offers in colors.items()}}, None
+    update = {"$push": {f"colors.$[c{i}].offers": push(offers) for i, offers in enumerate(colors.values())}}
+    return update, [{f"c{i}.color_id": str(color_id)} for i, color_id in enumerate(colors)]
+
+def pull_offers_updates(color_id, condition, layout=PARTS_COLORS_LAYOUT):
+    """
+    Updates removing the offers of a color matching `condition`.
+
+    Returns:
+        list: (query, update, array_filters) per stored layout, the queries
+        only match parts having the color.
+    """
+    color_id = str(color_id)
+    updates = []
+    if layout != 'array':
+        query = {f"colors.{color_id}": {"$exists": True}}
+        if layout == 'migrating':
+            query["$expr"] = IS_OBJECT_LAYOUT
+        updates.append((query, {"$pull": {f"colors.{color_id}": condition}}, None))
+    if layout != 'object':
+        updates.append(({"colors.color_id": color_id}, {"$pull": {"colors.$[color].offers": condition}}, [{"color.color_id": color_id}]))
+    return updates
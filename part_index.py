@@ -0,0 +1,114 @@
+from imports import *
+from indexes import ensure_indexes
+
+# Inverted index with one document per (part, color, set)
+PART_SET_INDEX_COLLECTION = DB['part_set_index']
+SET_CONTENTS_COLLECTION = DB['set_contents']
+
+def index_key(part_id, color):
+    return f"{part_id}|{color}"
+
+def index_entries(set_id, parts):
+    """
+    Build the index documents for the contents of one set.
+
+    Args:
+        set_id (str): Unique identifier of the set.
+        parts (dict): Set contents as {part_id: {"color": ..., "quantity": ...}}.
+
+    Returns:
+        list: Index documents.
+    """
+    set_total = sum(part['quantity'] for part in parts.values())
+    return [
+        {
+            "key": index_key(part_id, part['color']),
+            "part_id": str(part_id),
+            "color": str(part['color']),
+            "set_id": set_id,
+            "quantity": part['quantity'],
+            "set_total": set_total,
+        }
+        for part_id, part in parts.items()
+    ]
+
+def index_set(set_id, parts, session=None):
+    """Replace the index entries of a set with its current contents."""
+    PART_SET_INDEX_COLLECTION.delete_many({"set_id": set_id}, session=session)
+    entries = index_entries(set_id, parts)
+    if entries:
+        PART_SET_INDEX_COLLECTION.insert_many(entries, ordered=False, session=session)
+
+def index_sets(sets, batch_size=1000):
+    """
+    Replace the index entries of many sets at once.
+
+    Args:
+        sets (dict): {set_id: parts} with parts as in index_entries.
+    """
+    if not sets:
+        return
+    PART_SET_INDEX_COLLECTION.delete_many({"set_id": {"$in": list(sets)}})
+    entries = [entry for set_id, parts in sets.items() for entry in index_entries(set_id, parts)]
+    for start in range(0, len(entries), batch_size):
+        PART_SET_INDEX_COLLECTION.insert_many(entries[start:start + batch_size], ordered=False)
+
+def unindex_set(set_id, session=None):
+    PART_SET_INDEX_COLLECTION.delete_many({"set_id": set_id}, session=session)
+
+def sets_containing(part_id, color=None):
+    """
+    List the sets that contain a part, optionally only in one color.
+
+    Returns:
+        list: [{"set_id", "color", "quantity"}] ordered by quantity, largest first.
+    """
+    return list(PART_SET_INDEX_COLLECTION.find(**part_sets_find(part_id, color)))
+
+def part_sets_find(part_id, color=None):
+    query = {"key": index_key(part_id, color)} if color is not None else {"part_id": str(part_id)}
+    return {"filter": query, "projection": {"_id": 0, "set_id": 1, "color": 1, "quantity": 1}, "sort": [("quantity", -1)]}
+
+def completion_find(keys):
+    return {"filter": {"key": {"$in": list(keys)}}, "projection": {"_id": 0, "key": 1, "set_id": 1, "quantity": 1, "set_total": 1}}
+
+def set_completion(owned_parts):
+    """
+    Count how much of every set sharing at least one part with an inventory is owned.
+
+    Args:
+        owned_parts (dict): {(part_id, color): quantity} as built by user._get_all_parts.
+
+    Returns:
+        dict: {set_id: (owned_parts_count, total_parts_in_set)}
+    """
+    owned = {index_key(part_id, color): quantity for (part_id, color), quantity in owned_parts.items()}
+    if not owned:
+        return {}
+
+    completion = {}
+    cursor = PART_SET_INDEX_COLLECTION.find(**completion_find(owned))
+    for entry in cursor:
+        count, total = completion.get(entry['set_id'], (0, entry['set_total']))
+        completion[entry['set_id']] = (count + min(owned[entry['key']], entry['quantity']), total)
+    return completion
+
+def rebuild_index(batch_size=1000):
+    """Rebuild the whole index from set_contents."""
+    ensure_indexes(['part_set_index'])
+    PART_SET_INDEX_COLLECTION.delete_many({})
+
+    batch = []
+    indexed = 0
+    for set_contents in SET_CONTENTS_COLLECTION.find({}, {"parts": 1}):
+        batch.extend(index_entries(set_contents['_id'], set_contents.get('parts', {})))
+        indexed += 1
+        if len(batch) >= batch_size:
+            PART_SET_INDEX_COLLECTION.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        PART_SET_INDEX_COLLECTION.insert_many(batch, ordered=False)
+    print(f'Indexed {indexed} sets')
+
+if __name__ == '__main__':
+    rebuild_index()
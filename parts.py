@@ -1,71 +1,118 @@
 from imports import *
+from stats import record_stats_change
+from part_index import sets_containing
+from price_summary import summarize_part, part_summary_expression
+from pymongo import ReplaceOne, UpdateOne, ReturnDocument
+import re
+from color_registry import color_name, find_color_id
+from part_colors import (colors_to_dict, colors_for_storage, color_ids_expression, parts_by_color_pipeline,
+                         add_colors_expression, remove_colors_expression, push_offers_update, pull_offers_updates)
 
 parts_api = Blueprint('parts_api', __name__)
 PARTS_COLLECTION = DB['parts']
-COLORS_COLLECTION = DB['colors']
 
-#collor maping 
-def get_color_name_map():
-    """uptake all colors and map them {id: name}."""
-    return {str(color['_id']): color['name'] for color in COLORS_COLLECTION.find()}
+# Fields clients may request with ?fields=
+PART_FIELDS = ('_id', 'colors', 'price_summary')
+
+def to_part_listing(part):
+    part['_id'] = str(part['_id'])
+    return part
+
+# Recomputes price_summary from the stored colors inside pipeline updates
+PART_SUMMARY_STAGE = {"$set": {"price_summary": part_summary_expression()}}
+
+def to_part_detail(part):
+    """A part as the API exposes it, colors as {color_id: offers} whatever the stored layout."""
+    if 'colors' in part:
+        part['colors'] = colors_to_dict(part['colors'])
+    return part
+
+def part_detail(part):
+    """Body and status of the part route for the stored part, None when it does not exist."""
+    if not part:
+        return {'error': 'Part not found'}, 404
+    return to_part_detail(part), 200
+
+def part_overview_find(id):
+    return by_id_find(id, {"_id": 1, "colors": 1})
+
+def part_overview(part):
+    """Body and status of the part colors route, the part's color names in place of its offers."""
+    if not part:
+        return {'error': 'Part not found'}, 404
+    part_color_names = [color_name(color_id, f"Unknown ({color_id})") for color_id in colors_to_dict(part['colors']).keys()]
+    return {"_id": part["_id"], "colors": part_color_names}, 200
+
+INVALID_LIMIT_ERROR = 'Invalid limit value. Must be an integer.'
+
+def part_listing_pipeline(after, projection=None, limit=None):
+    """
+    Aggregation listing parts by _id with only the color ids of each part, so
+    the offers never leave the database.
+
+    Args:
+        after (str): Keyset pagination cursor.
+        projection (dict): Requested fields as returned by field_projection, None for every field.
+        limit (int): Page size, None for no limit.
+    """
+    color_ids = color_ids_expression()
+    pipeline = [{'$match': keyset_filter({}, after)}, {'$sort': {'_id': 1}}]
+    if limit:
+        pipeline.append({'$limit': limit})
+    if projection is None:
+        pipeline.append({'$addFields': {'colors': color_ids}})
+    else:
+        pipeline.append({'$project': {field: color_ids if field == 'colors' else 1 for field in projection}})
+    return pipeline
 
 @parts_api.route('')
 def get_parts():
     limit = request.args.get('limit', default=25, type=int)
-
-    @redis_cache(module='parts', expire=600, limit=limit)
-    def sub_get_parts():
-        result = list(PARTS_COLLECTION.find().limit(limit))
-        new_res = []
-        for part in result:
-            part['_id'] = str(part['_id'])
-            part['colors'] = [k for k in part['colors'].keys()]
-            new_res.append(part)
-        return jsonify(new_res), 200
+    after = request.args.get('after')
+    projection, error = field_projection(request.args.get('fields'), PART_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Streams the whole catalog (or `limit` parts) from `after` on with bounded memory
+    if wants_ndjson(request.accept_mimetypes):
+        pipeline = part_listing_pipeline(after, projection, limit if 'limit' in request.args else None)
+        return stream_ndjson(PARTS_COLLECTION.aggregate(pipeline), to_part_listing)
+
+    @redis_cache(module='parts', expire=600, limit=limit, tags=('parts',), stale=60)
+    def sub_get_parts(after, fields):
+        result = PARTS_COLLECTION.aggregate(part_listing_pipeline(after, projection, limit))
+        new_res = [to_part_listing(part) for part in result]
+        return jsonify(new_res), 200, next_page_headers(request.base_url, request.args.to_dict(), new_res, limit)
     
-    return sub_get_parts()
+    return sub_get_parts(after, ','.join(projection) if projection else None)
 
 
 @parts_api.route('/<id>')
-@redis_cache(module='parts', expire=60)
 def get_part(id):
-    color_map = get_color_name_map()
-    result = PARTS_COLLECTION.find_one({"_id": str(id)})
+    projection, error = field_projection(request.args.get('fields'), PART_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
 
-    if not result:
-        return jsonify({'error': 'Part not found'}), 404
-    
-    return jsonify(result), 200
+    @redis_cache(module='parts', expire=600, tags=('part:{id}',))
+    def sub_get_part(id, fields):
+        body, status = part_detail(PARTS_COLLECTION.find_one(**by_id_find(id, projection)))
+        return jsonify(body), status
+
+    return sub_get_part(id, ','.join(projection) if projection else None)
 
 @parts_api.route('/colors/<color>')
 def get_parts_by_color(color):
     limit = request.args.get('limit', default=25, type=int)
 
-    @redis_cache(module='parts', expire=60, limit=limit)
+    @redis_cache(module='parts', expire=600, limit=limit, tags=('parts', 'parts:offers'))
     def sub_get_by_color(color):
         
         if not limit:
-            return jsonify({'error': 'Invalid limit value. Must be an integer.'}), 400
+            return jsonify({'error': INVALID_LIMIT_ERROR}), 400
         
-        aggregation = [
-            {
-                '$match': {
-                    f'colors.{color}': {
-                        '$exists': True
-                    }
-                }
-            }, {
-                '$project': {
-                    'colors': {
-                        color: 1
-                    }
-                }
-            },
-            {'$limit': int(limit)}
-        ]
-
+        aggregation = parts_by_color_pipeline(color, limit)
         
-        return jsonify(list(PARTS_COLLECTION.aggregate(aggregation))), 200
+        return jsonify([to_part_detail(part) for part in PARTS_COLLECTION.aggregate(aggregation)]), 200
     
     return sub_get_by_color(color)
 
@@ -82,32 +129,27 @@ def validate_part_data(data, is_update=False):
         return "Invalid fields detected. Only '_id' and 'colors' are allowed."
     
     if not isinstance(data['colors'], dict):
-        return jsonify({'error': "'colors' must be a dictionary with color ids as keys and arrays of objects as values."}), 400
+        return "'colors' must be a dictionary with color ids as keys and arrays of objects as values."
 
+    for color, offers in data['colors'].items():
         if not isinstance(offers, list):
-            return f"'{color_key}' should have a list of offers."
+            return f"'{color}' should have a list of offers."
         
         for offer in offers:
             if not isinstance(offer, dict):
-                return jsonify({'error': f"Each offer for color '{color}' should be a dictionary."}), 400
+                return f"Each offer for color '{color}' should be a dictionary."
 
             if 'Link' in offer:
                 if 'Price' not in offer or 'Quantity' not in offer:
-                    return jsonify({'error': f"If a 'Link' is provided for color '{color}', both 'Price' and 'Quantity' must be present."}), 400
+                    return f"If a 'Link' is provided for color '{color}', both 'Price' and 'Quantity' must be present."
                 
                 if not isinstance(offer['Price'], (int, float)):
-                    return jsonify({'error': f"The 'Price' in offer for color '{color}' must be a number."}), 400
+                    return f"The 'Price' in offer for color '{color}' must be a number."
                 if not isinstance(offer['Quantity'], int):
-                    return jsonify({'error': f"The 'Quantity' in offer for color '{color}' must be an integer."}), 400
+                    return f"The 'Quantity' in offer for color '{color}' must be an integer."
             else:
                 if 'Price' in offer or 'Quantity' in offer:
-                    return jsonify({'error': f"If no 'Link' is provided for color '{color}', 'Price' and 'Quantity' cannot be specified."}), 400
-
-    result = PARTS_COLLECTION.update_one({"_id": str(id)}, {"$set": data})
-    if result.matched_count == 0:
-        return jsonify({'error': 'Part not found'}), 404
-
-    return jsonify({'modified_count': result.modified_count}), 200
+                    return f"If no 'Link' is provided for color '{color}', 'Price' and 'Quantity' cannot be specified."
 
 
 @parts_api.route('', methods=['POST'])
@@ -133,10 +175,14 @@ def update_part(id):
         return jsonify({'error': error_message}), 400
     
     data['_id'] = str(id)
+    data['price_summary'] = summarize_part(data['colors'])
+    data['colors'] = colors_for_storage(data['colors'])
     try:
         result = PARTS_COLLECTION.update_one({"_id": id}, {"$set": data})
         if result.matched_count == 0:
             return jsonify({'error': 'Part not found'}), 404
+        invalidate(f'part:{id}', 'parts', 'parts:offers')
+        record_stats_change('parts')
         return jsonify({'modified_count': result.modified_count})
     except Exception as e:
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
@@ -148,8 +194,12 @@ def create_part():
     if error_message:
         return jsonify({'error': error_message}), 400
     
+    data['price_summary'] = summarize_part(data['colors'])
+    data['colors'] = colors_for_storage(data['colors'])
     try:
         result = PARTS_COLLECTION.insert_one(data)
+        invalidate(f"part:{data['_id']}", 'parts', 'parts:offers')
+        record_stats_change('parts', total_parts=1)
         return jsonify({'inserted_id': str(result.inserted_id)}), 200
     except DuplicateKeyError:
         return jsonify({'error': f"Part with _id '{data['_id']}' already exists."}), 409
@@ -157,52 +207,97 @@ def create_part():
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
 
 
+@parts_api.route('/_bulk', methods=['POST'])
+def bulk_upsert_parts():
+    """
+    Create or replace many parts at once.
+
+    The body is a JSON array of parts or one part per line (application/x-ndjson).
+    Every part is validated first, the valid ones are then written with unordered
+    bulk upserts of `batch_size` operations (query argument).
+
+    Returns:
+        Counts per status and one result per item, in request order.
+    """
+    items, error = read_bulk_items()
+    if error:
+        return jsonify({'error': error}), 400
+    batch_size = request.args.get('batch_size', default=BULK_BATCH_SIZE, type=int)
+    if not batch_size or batch_size < 1:
+        return jsonify({'error': 'Invalid batch_size value. Must be a positive integer.'}), 400
+
+    results = [None] * len(items)
+    operations = []
+    positions = []
+    seen = set()
+    for position, data in enumerate(items):
+        error_message = validate_part_data(data)
+        if not error_message and str(data['_id']) in seen:
+            error_message = f"Part with _id '{data['_id']}' appears more than once."
+        if error_message:
+            results[position] = {'_id': data.get('_id') if isinstance(data, dict) else None, 'status': 'invalid', 'error': error_message}
+            continue
+        data['_id'] = str(data['_id'])
+        data['price_summary'] = summarize_part(data['colors'])
+        data['colors'] = colors_for_storage(data['colors'])
+        seen.add(data['_id'])
+        operations.append(ReplaceOne({"_id": data['_id']}, data, upsert=True))
+        positions.append(position)
+
+    for position, result in zip(positions, bulk_write_batches(PARTS_COLLECTION, operations, batch_size)):
+        results[position] = {'_id': items[position]['_id']} | result
+
+    if operations:
+        invalidate('parts', 'parts:offers', *(f'part:{part_id}' for part_id in seen))
+        record_stats_change('parts', total_parts=sum(result['status'] == 'created' for result in results))
+    return bulk_response(results)
+
 @parts_api.route('/<id>', methods=['DELETE'])
 def delete_part(id):
     result = PARTS_COLLECTION.delete_one({"_id": str(id)})
     if result.deleted_count == 0:
         return jsonify({'error': 'Part not found'}), 404
+    invalidate(f'part:{id}', 'parts', 'parts:offers')
+    record_stats_change('parts', total_parts=-1)
     return jsonify({'deleted_count': result.deleted_count}), 200
 
 @parts_api.route('/offers/<id>/<color>', methods=['GET'])
-@redis_cache(module='parts', expire=60)
+@redis_cache(module='parts', expire=600, tags=('part:{id}', 'colors'))
 def get_offers_by_color(id, color):
-    color = color.lower()
-    color_map = {v.lower(): k for k, v in get_color_name_map().items()}  # Odwrócona mapa
+    color_id = find_color_id(color)
     
-    if color not in color_map:
+    if color_id is None:
         return jsonify({'error': f'Color "{color}" not found'}), 404
-    
-    color_id = color_map[color]
 
     part = PARTS_COLLECTION.find_one({"_id": str(id)})
 
     if not part:
         return jsonify({'error': 'Part not found'}), 404
 
-    colors = part['colors']
+    colors = colors_to_dict(part['colors'])
 
-    if color not in colors:
+    if color_id not in colors:
         return jsonify({'error': f'No offers found for color "{color}"'}), 404
 
-    offers = colors[color]
+    offers = colors[color_id]
     return jsonify(offers), 200
 
 @parts_api.route('/<id>/colors', methods=['GET'])
-@redis_cache(module='parts', expire=60)
+@redis_cache(module='parts', expire=600, tags=('part:{id}', 'colors'))
 def get_part_overview(id):
-    color_map = get_color_name_map()
-    part = PARTS_COLLECTION.find_one({"_id": str(id)}, {"_id": 1, "colors": 1})
+    body, status = part_overview(PARTS_COLLECTION.find_one(**part_overview_find(id)))
+    return jsonify(body), status
 
-    if not part:
-        return jsonify({'error': 'Part not found'}), 404
 
-    color_names = [color_map.get(str(color_id), f"Unknown ({color_id})") for color_id in part['colors'].keys()]
+@parts_api.route('/<id>/sets', methods=['GET'])
+def get_part_sets(id):
+    color = request.args.get('color')
 
-    return jsonify({
-        "_id": part["_id"],
-        "colors": color_names
-    })
+    @redis_cache(module='parts', expire=600, tags=('sets',))
+    def sub_get_part_sets(id, color):
+        return jsonify(sets_containing(id, color)), 200
+
+    return sub_get_part_sets(id, color)
 
 
 @parts_api.route('/<id>/colors', methods=['POST'])
@@ -214,37 +309,36 @@ def add_colors_to_part(id):
 
     colors_input = data['colors']
     if isinstance(colors_input, str):
-        colors_to_add = [colors_input.strip().capitalize()]
+        colors_to_add = [colors_input]
     elif isinstance(colors_input, list) and all(isinstance(color, str) for color in colors_input):
-        colors_to_add = [str(colors_input) for color in colors_input]
+        colors_to_add = colors_input
     else:
         return jsonify({'error': "'colors' must be a string or a list of strings."}), 400
 
-    # Pobieramy mapę {name: _id}
-    color_map = {v.capitalize(): str(k) for k, v in get_color_name_map().items()}
-    
     # Sprawdzamy, czy podane kolory istnieją
-    color_ids_to_add = {color_map[color] for color in colors_to_add if color in color_map}
+    color_ids_to_add = {find_color_id(color) for color in colors_to_add} - {None}
     
     if not color_ids_to_add:
         return jsonify({'error': 'No valid colors found in database.'}), 400
 
-    part = PARTS_COLLECTION.find_one({"_id": str(id)})
+    # One atomic update, the color ids the part had before tell which ones are new
+    part = PARTS_COLLECTION.find_one_and_update(
+        {"_id": str(id)},
+        [{"$set": {"colors": add_colors_expression(sorted(color_ids_to_add))}}, PART_SUMMARY_STAGE],
+        projection={"color_ids": color_ids_expression()},
+        return_document=ReturnDocument.BEFORE,
+    )
 
     if not part:
         return jsonify({'error': 'Part not found'}), 404
 
-    part_colors = part.get('colors', {})
-    existing_colors = part_colors.keys()
-
-    new_colors = {color_id: [] for color_id in color_ids_to_add if color_id not in part_colors}
+    new_colors = sorted(color_ids_to_add - set(part['color_ids']))
 
     if not new_colors:
         return jsonify({'message': 'No new colors to add. All colors already exist.'}), 400
 
-    part_colors.update(new_colors)
-
-    PARTS_COLLECTION.update_one({"_id": str(id)}, {"$set": {"colors": part_colors}})
+    invalidate(f'part:{id}', 'parts', 'parts:offers')
+    record_stats_change('parts')
 
     return jsonify({'message': f'Colors added to part: {", ".join(new_colors)}.'}), 200
 
@@ -258,39 +352,37 @@ def delete_colors_from_part(id):
 
     colors_input = data['colors']
     if isinstance(colors_input, str):
-        colors_to_delete = [colors_input.strip().capitalize()]
+        colors_to_delete = [colors_input]
     elif isinstance(colors_input, list) and all(isinstance(color, str) for color in colors_input):
-        colors_to_delete = [str(color) for color in colors_input]
+        colors_to_delete = colors_input
     else:
         return jsonify({'error': "'colors' field must be a string or a list of strings."}), 400
 
-    # Pobieramy mapę {name: _id}
-    color_map = {v.capitalize(): str(k) for k, v in get_color_name_map().items()}
-    
     # Zamieniamy nazwy na `_id`
-    color_ids_to_delete = {color_map[color] for color in colors_to_delete if color in color_map}
+    color_ids_to_delete = {find_color_id(color) for color in colors_to_delete} - {None}
 
     if not color_ids_to_delete:
         return jsonify({'error': 'No valid colors found in database.'}), 400
 
-    part = PARTS_COLLECTION.find_one({"_id": str(id)})
+    part = PARTS_COLLECTION.find_one_and_update(
+        {"_id": str(id)},
+        [{"$set": {"colors": remove_colors_expression(color_ids_to_delete)}}, PART_SUMMARY_STAGE],
+        projection={"color_ids": color_ids_expression()},
+        return_document=ReturnDocument.BEFORE,
+    )
 
     if not part:
         return jsonify({'error': 'Part not found'}), 404
 
-    part_colors = part.get('colors', {})
-
-    colors_removed = [color_id for color_id in color_ids_to_delete if color_id in part_colors]
+    colors_removed = sorted(color_ids_to_delete & set(part['color_ids']))
 
     if not colors_removed:
         return jsonify({'message': 'No matching colors found to delete.'}), 404
 
-    for color_id in colors_removed:
-        del part_colors[color_id]
-
-    PARTS_COLLECTION.update_one({"_id": str(id)}, {"$set": {"colors": part_colors}})
+    invalidate(f'part:{id}', 'parts', 'parts:offers')
+    record_stats_change('parts')
 
-    removed_color_names = [color for color, color_id in color_map.items() if color_id in colors_removed]
+    removed_color_names = [color_name(color_id, color_id) for color_id in colors_removed]
     
     return jsonify({'message': f'Colors deleted from part: {", ".join(removed_color_names)}.'}), 200
 
@@ -319,22 +411,32 @@ def add_offer_to_part(id):
             if not isinstance(offer['Quantity'], int):
                 return jsonify({'error': f"The 'Quantity' in offer for color '{color}' must be an integer."}), 400
 
-    part = PARTS_COLLECTION.find_one({"_id": str(id)})
-
-    if not part:
-        return jsonify({'error': 'Part not found'}), 404
-
-    if 'colors' not in part:
-        part['colors'] = {}
+    if not colors:
+        return jsonify({'error': "'colors' must contain at least one color."}), 400
 
+    # The color ids become update paths, only existing ids are accepted
+    offers_by_color = {}
     for color, offers in colors.items():
-        if color not in part['colors']:
-            part['colors'][color] = []
+        color_id = find_color_id(color)
+        if color_id is None:
+            return jsonify({'error': f"Invalid color: '{color}'. It must be a valid name or existing ID in the database."}), 400
+        offers_by_color.setdefault(color_id, []).extend(offers)
+    colors = offers_by_color
+
+    # The offers are merged into the sorted lists by the server, then the
+    # summary is recomputed from the stored offers, in one ordered round trip
+    push, array_filters = push_offers_update(colors)
+    operations = [UpdateOne({"_id": str(id)}, push, array_filters=array_filters), UpdateOne({"_id": str(id)}, [PART_SUMMARY_STAGE])]
+    if array_filters:
+        # Offer lists are addressed by color_id, missing colors are added first
+        operations.insert(0, UpdateOne({"_id": str(id)}, [{"$set": {"colors": add_colors_expression(colors)}}]))
+    result = PARTS_COLLECTION.bulk_write(operations)
 
-        part['colors'][color].extend(offers)
-        part['colors'][color].sort(key=lambda x: x['Price'])
+    if result.matched_count == 0:
+        return jsonify({'error': 'Part not found'}), 404
 
-    PARTS_COLLECTION.update_one({"_id": str(id)}, {"$set": {"colors": part['colors']}})
+    invalidate(f'part:{id}', 'parts', 'parts:offers')
+    record_stats_change('parts')
 
     return jsonify({'message': 'Offers added successfully.'}), 200
 
@@ -349,54 +451,28 @@ def delete_offer_from_part(id):
     color_input = data['color']
     link = data['link'].strip().lower()
 
-    # Fetch color mapping {_id: name} and {name: _id} from the COLORS_COLLECTION
-    color_map_id_to_name = get_color_name_map()
-    color_map_name_to_id = {v: k for k, v in color_map_id_to_name.items()}
-
-    if isinstance(color_input, str):
-        color = color_input.strip()
-    else:
+    color_id = find_color_id(color_input) if isinstance(color_input, str) else None
+    if color_id is None:
         return jsonify({'error': f"Invalid color: '{color_input}'. It must be a valid name or existing ID in the database."}), 400
 
-    # Retrieve the part from the database
-    part = PARTS_COLLECTION.find_one({"_id": str(id)})
-
-    if not part:
-        return jsonify({'error': 'Part not found'}), 404
-
-    # Ensure the part has a 'colors' field
-    part_colors = part.get('colors', {})
-    if not part_colors:
-        return jsonify({'error': 'No colors found in this part.'}), 404
-
-    # Check if the specified color exists in the part
-    if color_id not in part_colors:
-        return jsonify({'error': f"Color '{color_map_id_to_name.get(color_id, color_id)}' not found in this part."}), 404
-
-    # Find the offer to remove by matching the link
-    offers = part_colors[color_id]
-    offer_to_remove = next((offer for offer in offers if offer.get('Link', '').strip().lower() == link), None)
+    # Links match case-insensitively, ignoring surrounding whitespace. The
+    # remaining offers stay sorted and the color keeps an empty list.
+    condition = {"Link": {"$regex": f"^\\s*{re.escape(link)}\\s*$", "$options": "i"}}
+    result = PARTS_COLLECTION.bulk_write([
+        UpdateOne({"_id": str(id)} | query, update, array_filters=array_filters)
+        for query, update, array_filters in pull_offers_updates(color_id, condition)
+    ], ordered=False)
 
-    if not offer_to_remove:
-        return jsonify({'error': f"Offer with the specified link not found in color '{color_map_id_to_name.get(color_id, color_id)}'."}), 404
-
-    # Remove the offer
-    part_colors[color_id].remove(offer_to_remove)
-
-    # If no offers remain for the color, keep an empty list (avoid deleting the color entry)
-    if not part_colors[color_id]:
-        part_colors[color_id] = []
-
-    # Sort the remaining offers by price (ascending) and quantity (descending)
-    part_colors[color_id].sort(key=lambda x: (x.get('Price', float('inf')), -x.get('Quantity', 0)))
+    if result.matched_count == 0:
+        if not PARTS_COLLECTION.find_one({"_id": str(id)}, {"_id": 1}):
+            return jsonify({'error': 'Part not found'}), 404
+        return jsonify({'error': f"Color '{color_name(color_id, color_id)}' not found in this part."}), 404
 
-    # Update the part in the database
-    update_result = PARTS_COLLECTION.update_one(
-        {"_id": str(id)},
-        {"$set": {"colors": part_colors}}
-    )
+    if result.modified_count == 0:
+        return jsonify({'error': f"Offer with the specified link not found in color '{color_name(color_id, color_id)}'."}), 404
 
-    if update_result.modified_count == 0:
-        return jsonify({'error': 'Failed to update the part in the database.'}), 500
+    PARTS_COLLECTION.update_one({"_id": str(id)}, [PART_SUMMARY_STAGE])
+    invalidate(f'part:{id}', 'parts', 'parts:offers')
+    record_stats_change('parts')
 
-    return jsonify({'message': f"Offer deleted from color '{color_map_id_to_name.get(color_id, color_id)}'."}), 200
+    return jsonify({'message': f"Offer deleted from color '{color_name(color_id, color_id)}'."}), 200
@@ -0,0 +1,78 @@
+from imports import *
+from collections import Counter
+import atexit
+
+# Set visits are counted in memory and added to a sorted set by a background
+# thread, so GET /sets/<id> never waits on a Redis write
+POPULAR_SETS_KEY = 'sets:popular'
+POPULARITY_FLUSH_INTERVAL = float(os.getenv('POPULARITY_FLUSH_INTERVAL', 5))
+
+_visits = Counter()
+_visits_lock = threading.Lock()
+_flusher = None
+
+def record_visit(set_id):
+    _start_popularity_flusher()
+    with _visits_lock:
+        _visits[str(set_id)] += 1
+
+def flush_visits():
+    """Send the buffered visits with one pipelined ZINCRBY per visited set."""
+    global _visits
+    with _visits_lock:
+        visits, _visits = _visits, Counter()
+    if not visits:
+        return
+    try:
+        pipe = REDIS.pipeline(transaction=False)
+        for set_id, count in visits.items():
+            pipe.zincrby(POPULAR_SETS_KEY, count, set_id)
+        pipe.execute()
+    except redis.RedisError:
+        # Keep the counts for the next flush
+        with _visits_lock:
+            _visits.update(visits)
+        raise
+
+def _run_popularity_flusher():
+    while True:
+        time.sleep(POPULARITY_FLUSH_INTERVAL)
+        try:
+            flush_visits()
+        except Exception as e:
+            print('Popularity flush failed', e)
+
+def _start_popularity_flusher():
+    global _flusher
+    with _visits_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_popularity_flusher, daemon=True)
+            _flusher.start()
+            atexit.register(flush_visits)
+
+def top_sets(count):
+    """
+    The most visited sets.
+
+    Returns:
+        list: [(set_id, visit_count)], most visited first.
+    """
+    return [(set_id, int(score)) for set_id, score in REDIS.zrevrange(POPULAR_SETS_KEY, 0, count - 1, withscores=True)]
+
+def forget_set(set_id):
+    REDIS.zrem(POPULAR_SETS_KEY, str(set_id))
+
+def import_visit_counts():
+    """Seed the sorted set from the visit_count fields of the set:<id> stats hashes."""
+    from redis_setup import get_all_set_stats
+    scores = {}
+    for entry in get_all_set_stats():
+        for set_key, stats in entry.items():
+            if int(stats.get('visit_count') or 0):
+                scores[set_key.split(':')[1]] = int(stats['visit_count'])
+    if scores:
+        REDIS.zadd(POPULAR_SETS_KEY, scores)
+    print(f'Imported visit counts of {len(scores)} sets')
+
+if __name__ == '__main__':
+    import_visit_counts()
@@ -0,0 +1,127 @@
+from imports import *
+from pymongo import UpdateOne
+from indexes import ensure_indexes
+from part_colors import colors_to_dict
+
+PARTS_COLLECTION = DB['parts']
+SET_OVERVIEWS_COLLECTION = DB['set_overviews']
+SET_OFFERS_COLLECTION = DB['set_offers']
+
+def summarize_offers(offers, price_key='Price'):
+    """
+    Summarize a list of offers.
+
+    Returns:
+        dict: {"min_price", "max_price", "offer_count"}, prices are None without priced offers.
+    """
+    prices = [offer[price_key] for offer in offers if isinstance(offer, dict) and isinstance(offer.get(price_key), (int, float))]
+    return {
+        "min_price": min(prices) if prices else None,
+        "max_price": max(prices) if prices else None,
+        "offer_count": len(offers),
+    }
+
+def summarize_part(colors):
+    """
+    Build the price_summary stored on a part document.
+
+    Args:
+        colors (dict): The part's {color_id: [offers]}.
+
+    Returns:
+        dict: Overall min_price, max_price and offer_count plus the same figures per color.
+    """
+    per_color = {str(color): summarize_offers(offers) for color, offers in (colors or {}).items()}
+    min_prices = [s["min_price"] for s in per_color.values() if s["min_price"] is not None]
+    max_prices = [s["max_price"] for s in per_color.values() if s["max_price"] is not None]
+    return {
+        "min_price": min(min_prices) if min_prices else None,
+        "max_price": max(max_prices) if max_prices else None,
+        "offer_count": sum(s["offer_count"] for s in per_color.values()),
+        "colors": per_color,
+    }
+
+def part_summary_expression():
+    """
+    Aggregation expression computing summarize_part server-side, for updates
+    that change the offers without reading the part.
+    """
+    entries = {"$cond": [
+        {"$isArray": "$colors"},
+        {"$map": {"input": "$colors", "in": {"k": "$$this.color_id", "v": "$$this.offers"}}},
+        {"$objectToArray": {"$ifNull": ["$colors", {}]}},
+    ]}
+    per_color = {"$map": {"input": entries, "as": "color", "in": {"k": "$$color.k", "v": {"$let": {
+        "vars": {"prices": {"$map": {
+            "input": {"$filter": {"input": {"$ifNull": ["$$color.v", []]}, "cond": {"$isNumber": "$$this.Price"}}},
+            "in": "$$this.Price",
+        }}},
+        "in": {
+            "min_price": {"$min": "$$prices"},
+            "max_price": {"$max": "$$prices"},
+            "offer_count": {"$size": {"$ifNull": ["$$color.v", []]}},
+        },
+    }}}}}
+    return {"$let": {"vars": {"per_color": per_color}, "in": {
+        "min_price": {"$min": "$$per_color.v.min_price"},
+        "max_price": {"$max": "$$per_color.v.max_price"},
+        "offer_count": {"$sum": "$$per_color.v.offer_count"},
+        "colors": {"$arrayToObject": "$$per_color"},
+    }}}
+
+def summarize_set(offers):
+    """
+    Build the price fields stored on a set overview from its offers.
+
+    Returns:
+        dict: {"min_offer", "max_offer", "offer_count"}
+    """
+    summary = summarize_offers(offers, price_key='price')
+    return {
+        "min_offer": summary["min_price"],
+        "max_offer": summary["max_price"],
+        "offer_count": summary["offer_count"],
+    }
+
+def _flush(collection, operations, tags):
+    """Write a batch of summaries and drop the cached responses tagged with its documents."""
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+        invalidate(*tags)
+    return len(operations)
+
+def backfill(batch_size=1000):
+    """Compute the summaries for every existing part and set."""
+    operations, tags = [], []
+    updated = 0
+    for part in PARTS_COLLECTION.find({}, {"colors": 1}):
+        colors = part.get("colors")
+        if not isinstance(colors, (dict, list)):
+            continue
+        operations.append(UpdateOne({"_id": part["_id"]}, {"$set": {"price_summary": summarize_part(colors_to_dict(colors))}}))
+        tags.append(f'part:{part["_id"]}')
+        if len(operations) >= batch_size:
+            updated += _flush(PARTS_COLLECTION, operations, tags)
+            operations, tags = [], []
+    updated += _flush(PARTS_COLLECTION, operations, tags)
+    # Listing pages return the summaries too
+    invalidate('parts', 'parts:offers')
+    print(f'Summarized {updated} parts')
+
+    operations, tags = [], []
+    updated = 0
+    for set_offers in SET_OFFERS_COLLECTION.find({}, {"offers": 1}):
+        summary = summarize_set(set_offers.get("offers") or [])
+        operations.append(UpdateOne({"_id": set_offers["_id"]}, {"$set": summary}))
+        tags.append(f'set:{set_offers["_id"]}')
+        if len(operations) >= batch_size:
+            updated += _flush(SET_OVERVIEWS_COLLECTION, operations, tags)
+            operations, tags = [], []
+    updated += _flush(SET_OVERVIEWS_COLLECTION, operations, tags)
+    invalidate('sets')
+    print(f'Summarized {updated} sets')
+
+    ensure_indexes(['parts', 'set_overviews'])
+
+if __name__ == '__main__':
+    backfill()
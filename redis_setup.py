@@ -1,19 +1,32 @@
 from imports import *
+import argparse
 
+# Admin commands for the per-set stats hashes
+#
+#   python redis_setup.py put-sets [--batch-size N]
+#   python redis_setup.py stats [--limit N]
 SETS_COLLECTION = DB['set_overviews']
 PARTS_COLLECTION = DB['parts']
+# Redis commands sent per pipeline round trip
+SET_STATS_BATCH_SIZE = int(os.getenv('SET_STATS_BATCH_SIZE', 5000))
 
 def all_set_ids():
-    return set(str(_set['_id']) for _set in SETS_COLLECTION.find({}))
+    return set(str(_set['_id']) for _set in SETS_COLLECTION.find({}, {"_id": 1}))
 
 def all_part_ids():
-    return set(str(part['_id']) for part in PARTS_COLLECTION.find({}))
+    return set(str(part['_id']) for part in PARTS_COLLECTION.find({}, {"_id": 1}))
 
+def _set_stats(visit_count=0, brick_value=0.0, profit_value=0.0):
+    return {
+        "visit_count": visit_count,
+        # "brick_value": brick_value,
+        # "profit_value": profit_value
+    }
 
 def store_set_stats(set_id, visit_count=0, brick_value=0.0, profit_value=0.0):
     """
     Store stats for a set in Redis.
-    
+
     Args:
         set_id (str): Unique identifier of the set.
         visit_count (int): Visit count for the set.
@@ -21,45 +34,73 @@ def store_set_stats(set_id, visit_count=0, brick_value=0.0, profit_value=0.0):
         profit_value (float): Profit value of the set.
     """
     set_key = f"set:{set_id}"
-    stats = {
-        "visit_count": visit_count,
-        # "brick_value": brick_value,
-        # "profit_value": profit_value
-    }
-    
+    pipe = REDIS.pipeline(transaction=False)
     # Store the stats in a Redis hash
-    REDIS.hmset(set_key, stats)
-    
+    pipe.hset(set_key, mapping=_set_stats(visit_count, brick_value, profit_value))
     # Track the set key in a global set of all sets
-    REDIS.sadd("all_sets", set_key)
+    pipe.sadd("all_sets", set_key)
+    pipe.execute()
 
-def put_sets():
-    for _set in all_set_ids():
-        store_set_stats(_set)
+def put_sets(batch_size=SET_STATS_BATCH_SIZE):
+    """
+    Initialize the stats of every set, one pipelined round trip per `batch_size` sets.
+
+    Returns:
+        int: The number of sets stored.
+    """
+    set_keys = [f"set:{set_id}" for set_id in all_set_ids()]
+    for start in range(0, len(set_keys), batch_size):
+        batch = set_keys[start:start + batch_size]
+        pipe = REDIS.pipeline(transaction=False)
+        for set_key in batch:
+            pipe.hset(set_key, mapping=_set_stats())
+        pipe.sadd("all_sets", *batch)
+        pipe.execute()
+    return len(set_keys)
 
 def get_set_stats(set_id):
     """
     Get stats for a set from Redis.
-    
+
     Args:
         set_id (str): Unique identifier of the set.
-        
+
     Returns:
         dict: Stats for the set.
     """
     set_key = f"set:{set_id}"
     stats = REDIS.hgetall(set_key)
     return stats
-    
-def get_all_set_stats():
+
+def get_all_set_stats(batch_size=SET_STATS_BATCH_SIZE):
     """
-    Get stats for all sets from Redis.
-    
+    Get stats for all sets from Redis: the key list, then one pipelined
+    round trip per `batch_size` sets.
+
     Returns:
         list: Stats for all sets.
     """
-    all_sets = REDIS.smembers("all_sets")
-    stats = [{set_key: REDIS.hgetall(set_key)} for set_key in all_sets]
+    all_sets = list(REDIS.smembers("all_sets"))
+    stats = []
+    for start in range(0, len(all_sets), batch_size):
+        batch = all_sets[start:start + batch_size]
+        pipe = REDIS.pipeline(transaction=False)
+        for set_key in batch:
+            pipe.hgetall(set_key)
+        stats.extend({set_key: set_stats} for set_key, set_stats in zip(batch, pipe.execute()))
     return stats
 
-print(get_all_set_stats()[:10])
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the per-set stats stored in Redis.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    put_parser = subparsers.add_parser('put-sets', help='Initialize the stats of every set')
+    put_parser.add_argument('--batch-size', type=int, default=SET_STATS_BATCH_SIZE)
+    stats_parser = subparsers.add_parser('stats', help='Print the stored stats')
+    stats_parser.add_argument('--batch-size', type=int, default=SET_STATS_BATCH_SIZE)
+    stats_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'put-sets':
+        print(f'Stored stats of {put_sets(args.batch_size)} sets')
+    else:
+        print(get_all_set_stats(args.batch_size)[:args.limit])
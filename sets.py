@@ -1,4 +1,11 @@
 from imports import *
+from stats import record_stats_change
+from part_index import index_set, index_sets, unindex_set
+from price_summary import summarize_set
+from similarity import find_similar_sets, push_similarities, index_set_bands, index_sets_bands, unindex_set_bands
+from pymongo import UpdateOne, ReplaceOne
+from popularity import record_visit, top_sets, forget_set
+from leaderboards import rank_sets, rank_set_ids, unrank_set, ranked_overviews, parse_count, leaderboard_response, INVALID_COUNT_ERROR
 
 sets_api = Blueprint('sets_api', __name__)
 SET_OVERVIEWS_COLLECTION = DB['set_overviews']
@@ -7,35 +14,77 @@ SET_SIMILARITIES_COLLECTION = DB['set_similiarities']
 SET_CONTENTS_COLLECTION = DB['set_contents']
 PARTS_COLLECTION = DB['parts']
 
+# Fields clients may request with ?fields=, a set's parts and offers are stored apart from its overview
+SET_FIELDS = ('_id', 'name', 'year', 'num_parts', 'price', 'min_price', 'min_offer', 'max_offer', 'offer_count', 'sim_scores')
+SET_DETAIL_FIELDS = SET_FIELDS + ('parts', 'offers')
+
+def to_set_listing(set):
+    set['_id'] = str(set['_id'])
+    return set
+
 @sets_api.route('')
 def get_sets():
     limit = request.args.get('limit', 25)
+    after = request.args.get('after')
+    projection, error = field_projection(request.args.get('fields'), SET_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Streams every set (or `limit` sets) from `after` on with bounded memory
+    if wants_ndjson(request.accept_mimetypes):
+        cursor = SET_OVERVIEWS_COLLECTION.find(**listing_find(after, projection, limit if 'limit' in request.args else None))
+        return stream_ndjson(cursor, to_set_listing)
 
-    @redis_cache(module='colors', expire=600, limit=limit)
-    def sub_get_sets():
-        result = list(SET_OVERVIEWS_COLLECTION.find().limit(int(limit)))
-        for set in result:
-            set['_id'] = str(set['_id'])    
-        return jsonify(result)
-    return sub_get_sets()
+    @redis_cache(module='sets', expire=600, limit=limit, tags=('sets',), stale=60)
+    def sub_get_sets(after, fields):
+        result = SET_OVERVIEWS_COLLECTION.find(**listing_find(after, projection, limit))
+        result = [to_set_listing(set) for set in result]
+        return jsonify(result), 200, next_page_headers(request.base_url, request.args.to_dict(), result, int(limit))
+    return sub_get_sets(after, ','.join(projection) if projection else None)
+
+def set_overview_projection(projection):
+    """The overview fields of a set detail projection, None for every field."""
+    if projection is None:
+        return None
+    return {field: 1 for field in projection if field not in ('parts', 'offers')}
+
+def wants_field(projection, field):
+    return projection is None or field in projection
+
+def set_detail(overview, contents=None, offers=None):
+    """Body and status of the set route from the overview and the requested contents and offers documents."""
+    if not overview:
+        return {'error': 'Set not found.'}, 404
+    if contents:
+        overview = overview | contents
+    if offers:
+        overview = overview | offers
+    return overview, 200
 
 @sets_api.route('/<id>')
-@redis_cache(module='sets', expire=600)
 def get_set(id):
-    result = SET_OVERVIEWS_COLLECTION.find_one({"_id": str(id)})
-    offers = SET_OFFERS_COLLECTION.find_one({"_id": str(id)})
-    contents = SET_CONTENTS_COLLECTION.find_one({"_id": str(id)})
+    projection, error = field_projection(request.args.get('fields'), SET_DETAIL_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
 
-    if not result:
-        return jsonify({'error': 'Set not found.'}), 404
+    @redis_cache(module='sets', expire=600, tags=('set:{id}',), stale=60)
+    def sub_get_set(id, fields):
+        result = SET_OVERVIEWS_COLLECTION.find_one(**by_id_find(id, set_overview_projection(projection)))
 
-    result = result | contents
-    if offers:
-        result = result | offers
-    
-    # if result:
-    #     REDIS.hincrby(f"set:{id}", "visit_count", 1)
-    return jsonify(result)
+        # Contents and offers are only read for an existing set and when they were asked for
+        contents = offers = None
+        if result and wants_field(projection, 'parts'):
+            contents = SET_CONTENTS_COLLECTION.find_one(**by_id_find(id, {"parts": 1}))
+        if result and wants_field(projection, 'offers'):
+            offers = SET_OFFERS_COLLECTION.find_one(**by_id_find(id, {"offers": 1}))
+        body, status = set_detail(result, contents, offers)
+        return jsonify(body), status
+
+    response = sub_get_set(id, ','.join(projection) if projection else None)
+    # Counted outside the cache so cached responses are visits too
+    if response.status_code == 200:
+        record_visit(id)
+    return response
 
 @sets_api.route('/<id>/offers', methods=['PUT', 'POST'])
 def update_set_offers(id):
@@ -53,81 +102,176 @@ def update_set_offers(id):
             print(offer['price'], type(offer['price']))
             return jsonify({'error': 'Price must be a float.'}), 400
     
-    min_price = data[0]["price"]
+    summary = summarize_set(data)
 
-    def transaction_callback(session, data, id, min_price):
-        r1 = SET_OVERVIEWS_COLLECTION.update_one({"_id": id}, {"$set": {"min_price": min_price}}, upsert=True)
-        result = SET_OFFERS_COLLECTION.update_one({"_id": id}, {"$set": {"offers": data}}, upsert=True)
+    def transaction_callback(session, data, id, summary):
+        r1 = SET_OVERVIEWS_COLLECTION.update_one({"_id": id}, {"$set": {"min_price": summary["min_offer"], **summary}}, upsert=True, session=session)
+        result = SET_OFFERS_COLLECTION.update_one({"_id": id}, {"$set": {"offers": data}}, upsert=True, session=session)
 
     try:
         with CLIENT.start_session() as session:
             with session.start_transaction():
-                transaction_callback(session, data, id, min_price)
+                transaction_callback(session, data, id, summary)
                 session.commit_transaction()
+        rank_set_ids([id])
+        invalidate(f'set:{id}', 'sets')
+        record_stats_change('sets')
         return jsonify({'message': 'Offers updated successfully.'}), 200
     except Exception as e:
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
 
-@sets_api.route('', methods=['POST'])
-def create_set():
-    data = request.json
-
+def validate_set_data(data):
     if not data or not isinstance(data, dict):
-        return jsonify({'error': 'Invalid input. JSON body is required.'}), 400
+        return 'Invalid input. JSON body is required.'
 
     required_fields = ['_id', 'name', 'year', 'num_parts', 'parts']
     missing_fields = [field for field in required_fields if field not in data]
     if missing_fields:
-        return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        return f'Missing required fields: {", ".join(missing_fields)}'
 
     if not isinstance(data['parts'], dict):
-        return jsonify({'error': "'parts' must be a dictionary with part IDs as keys and objects as values."}), 400
-
-    sim_scores = []
-    part_keys = data['parts'].keys()
-    for other_set_contents in SET_CONTENTS_COLLECTION.find():
-        parts_in_common = 0
-        for other_part in other_set_contents.items():
-            if other_part[0] in part_keys:
-                if other_set_contents[1]['color'] in data['parts'][other_part[0]]['colors']:
-                    parts_in_common += min(other_set_contents['quantity'], data['parts'][other_part[0]]['quantity'])
-        if parts_in_common > 0:
-            total_parts = len(other_set_contents)
-            sim_score = round(parts_in_common / total_parts, 2)
-            sim_scores.append((other_set_contents["_id"], sim_score))
-            SET_SIMILARITIES_COLLECTION.update_one(
-                {"_id": other_set_contents["_id"]},
-                {"$push": {"sim_scores": {"_id": data["_id"], "sim_score": sim_score}}},
-                upsert=True
-            )
-
-    if not isinstance(data['sim_scores'], list):
-        return jsonify({'error': "'sim_scores' must be a list."}), 400
-
-    for part_id, part_data in data['parts'].items():
-        existing_part = PARTS_COLLECTION.find_one({"_id": part_id})
-        if not existing_part:
-            try:
-                part_data["_id"] = part_id  
-                PARTS_COLLECTION.insert_one(part_data)
-            except DuplicateKeyError:
-                pass 
+        return "'parts' must be a dictionary with part IDs as keys and objects as values."
+
+    # Similarity scoring and indexing read every part's color and quantity
+    for part_id, part in data['parts'].items():
+        if not part_id or '.' in part_id or part_id.startswith('$'):
+            return f"Invalid part ID '{part_id}'. It must be non-empty, without '.' and not start with '$'."
+        if not isinstance(part, dict):
+            return f"Part '{part_id}' must be an object with 'color' and 'quantity'."
+        if 'color' not in part or 'quantity' not in part:
+            return f"Part '{part_id}' is missing 'color' or 'quantity'."
+        if isinstance(part['color'], bool) or not isinstance(part['color'], (str, int)):
+            return f"'color' of part '{part_id}' must be a color ID."
+        if isinstance(part['quantity'], bool) or not isinstance(part['quantity'], int) or part['quantity'] < 1:
+            return f"'quantity' of part '{part_id}' must be a positive integer."
+
+    if not isinstance(data.get('sim_scores', []), list):
+        return "'sim_scores' must be a list."
+
+def insert_missing_parts(parts):
+    """
+    Add the parts of new sets that are not in the catalog yet, in one unordered bulk write.
+
+    Args:
+        parts (dict): {part_id: part_data}
+
+    Returns:
+        int: The number of parts created.
+    """
+    operations = [
+        UpdateOne({"_id": part_id}, {"$setOnInsert": {k: v for k, v in part_data.items() if k != '_id'}}, upsert=True)
+        for part_id, part_data in parts.items()
+    ]
+    new_parts = sum(result['status'] == 'created' for result in bulk_write_batches(PARTS_COLLECTION, operations))
+    if new_parts:
+        record_stats_change('parts', total_parts=new_parts)
+    return new_parts
+
+@sets_api.route('', methods=['POST'])
+def create_set():
+    data = request.json
+
+    error_message = validate_set_data(data)
+    if error_message:
+        return jsonify({'error': error_message}), 400
+
+    # Only sets sharing an LSH band with the new one are scored exactly
+    sim_scores = find_similar_sets(data['_id'], data['parts'])
+    data.setdefault('sim_scores', [{"_id": other_id, "sim_score": sim_score} for other_id, sim_score in sim_scores])
+
+    insert_missing_parts(data['parts'])
 
     try:
         with CLIENT.start_session() as session:
             with session.start_transaction():
                 SET_OFFERS_COLLECTION.insert_one({"_id": data["_id"], "offers": []}, session=session)
                 SET_CONTENTS_COLLECTION.insert_one({"_id": data["_id"], "parts": data["parts"]}, session=session)
+                index_set(data["_id"], data["parts"], session=session)
+                index_set_bands(data["_id"], data["parts"], session=session)
                 SET_SIMILARITIES_COLLECTION.insert_one({"_id": data["_id"], "sim_scores": data["sim_scores"]}, session=session)
                 del data['parts']
                 result = SET_OVERVIEWS_COLLECTION.insert_one(data, session=session)
                 session.commit_transaction()
+                push_similarities(data["_id"], sim_scores)
+                rank_sets([data])
+                invalidate(f"set:{data['_id']}", 'sets', 'parts')
+                record_stats_change('sets', total_sets=1)
                 return jsonify({'inserted_id': str(result.inserted_id)}), 201
     except DuplicateKeyError as e:
         return jsonify({'error': f"Duplicate key error: {str(e)}"}), 409
     except Exception as e:
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
 
+@sets_api.route('/_bulk', methods=['POST'])
+def bulk_upsert_sets():
+    """
+    Create or update many sets at once.
+
+    The body is a JSON array of sets or one set per line (application/x-ndjson).
+    Every set is validated first, the valid ones are then written with unordered
+    bulk upserts of `batch_size` operations (query argument). Offers and their
+    summaries of existing sets are kept.
+
+    Returns:
+        Counts per status and one result per item, in request order.
+    """
+    items, error = read_bulk_items()
+    if error:
+        return jsonify({'error': error}), 400
+    batch_size = request.args.get('batch_size', default=BULK_BATCH_SIZE, type=int)
+    if not batch_size or batch_size < 1:
+        return jsonify({'error': 'Invalid batch_size value. Must be a positive integer.'}), 400
+
+    results = [None] * len(items)
+    sets = {}
+    positions = []
+    for position, data in enumerate(items):
+        error_message = validate_set_data(data)
+        if not error_message and str(data['_id']) in sets:
+            error_message = f"Set with _id '{data['_id']}' appears more than once."
+        if error_message:
+            results[position] = {'_id': data.get('_id') if isinstance(data, dict) else None, 'status': 'invalid', 'error': error_message}
+            continue
+        data['_id'] = str(data['_id'])
+        sets[data['_id']] = data
+        positions.append(position)
+
+    if not sets:
+        return bulk_response(results)
+
+    insert_missing_parts({part_id: part for data in sets.values() for part_id, part in data['parts'].items()})
+    contents = {set_id: data.pop('parts') for set_id, data in sets.items()}
+    content_results = bulk_write_batches(SET_CONTENTS_COLLECTION, [
+        ReplaceOne({"_id": set_id}, {"_id": set_id, "parts": parts}, upsert=True) for set_id, parts in contents.items()
+    ], batch_size)
+    bulk_write_batches(SET_OFFERS_COLLECTION, [
+        UpdateOne({"_id": set_id}, {"$setOnInsert": {"offers": []}}, upsert=True) for set_id in sets
+    ], batch_size)
+    index_sets(contents)
+    index_sets_bands(contents)
+
+    # The whole wave is in the LSH index now, so its sets are also scored against each other
+    for set_id, data in sets.items():
+        sim_scores = find_similar_sets(set_id, contents[set_id])
+        data.setdefault('sim_scores', [{"_id": other_id, "sim_score": sim_score} for other_id, sim_score in sim_scores])
+        push_similarities(set_id, [(other_id, sim_score) for other_id, sim_score in sim_scores if other_id not in sets])
+    bulk_write_batches(SET_SIMILARITIES_COLLECTION, [
+        ReplaceOne({"_id": set_id}, {"_id": set_id, "sim_scores": data['sim_scores']}, upsert=True) for set_id, data in sets.items()
+    ], batch_size)
+
+    overview_results = bulk_write_batches(SET_OVERVIEWS_COLLECTION, [
+        UpdateOne({"_id": set_id}, {"$set": data}, upsert=True) for set_id, data in sets.items()
+    ], batch_size)
+
+    for position, content_result, overview_result in zip(positions, content_results, overview_results):
+        result = content_result if content_result['status'] == 'failed' else overview_result
+        results[position] = {'_id': items[position]['_id']} | result
+
+    rank_set_ids(sets)
+    invalidate('sets', 'parts', *(f'set:{set_id}' for set_id in sets))
+    record_stats_change('sets', total_sets=sum(result['status'] == 'created' for result in overview_results))
+    return bulk_response(results)
+
 @sets_api.route('/<id>', methods=['DELETE'])
 def delete_set(id):
     try:
@@ -141,94 +285,53 @@ def delete_set(id):
                 SET_SIMILARITIES_COLLECTION.delete_one({"_id": id}, session=session)
                 SET_OFFERS_COLLECTION.delete_one({"_id": id}, session=session)
                 SET_CONTENTS_COLLECTION.delete_one({"_id": id}, session=session)
+                unindex_set(id, session=session)
+                unindex_set_bands(id, session=session)
                 
                 session.commit_transaction()
+                forget_set(id)
+                unrank_set(id)
+                invalidate(f'set:{id}', 'sets')
+                record_stats_change('sets', total_sets=-1)
                 return jsonify({'deleted_count': result.deleted_count})
     except Exception as e:
         return jsonify({'error': 'An unexpected error occurred.', 'details': str(e)}), 500
 
+def leaderboard(board, x):
+    count = parse_count(x)
+    overviews = ranked_overviews(board, count) if count is not None else None
+    body, status = leaderboard_response(count, overviews)
+    return jsonify(body), status
+
 @sets_api.route('/profitable/<x>')
-@redis_cache(module='sets', expire=60)
+@redis_cache(module='sets', expire=600, tags=('sets',))
 def get_profitable_sets(x):
-    pipeline = [
-        {
-            "$match": {
-                "min_offer": {
-                    "$exists": True,
-                },
-                "price": {
-                    "$exists": True
-                }
-            }
-        },
-        {
-            "$addFields": {
-                "difference": {
-                    "$subtract": [
-                        "$price",
-                        "$min_offer"
-                    ]
-                }
-            }
-        },
-        {
-            "$sort": {
-                "difference": -1
-            }
-        },
-        {
-            "$project": {
-                "difference": 0
-            }
-        },
-        {
-            "$limit": int(x)
-        }
-    ]
-        
-    top_sets = list(SET_OVERVIEWS_COLLECTION.aggregate(pipeline))
-    return top_sets
+    # Largest price - min_offer first
+    return leaderboard('profitable', x)
 
 @sets_api.route('/popular/<x>')
-@redis_cache(module='sets', expire=60)
+@redis_cache(module='sets', expire=60, tags=('sets',), stale=5)
 def get_popular_sets(x):
-    all_sets = REDIS.smembers("all_sets")
-    popular_sets = []
-    for set_key in all_sets:
-        visit_count = REDIS.hget(set_key, "visit_count")
-        popular_sets.append({"_id": set_key.split(":")[1], "visit_count": visit_count})
-    popular_sets = sorted(popular_sets, key=lambda x: x['visit_count'], reverse=True)[:int(x)]
-    result = []
-    for s in popular_sets:
-        result.append(SET_OVERVIEWS_COLLECTION.find_one({"_id": s["_id"]}))
+    count = parse_count(x)
+    if count is None:
+        return jsonify({'error': INVALID_COUNT_ERROR}), 400
+    popular_sets = top_sets(count)
+    overviews = {
+        overview['_id']: overview
+        for overview in SET_OVERVIEWS_COLLECTION.find(**by_ids_find(set_id for set_id, _ in popular_sets))
+    }
+    result = [
+        overviews[set_id] | {"visit_count": visit_count}
+        for set_id, visit_count in popular_sets if set_id in overviews
+    ]
     return jsonify(result)
 
 @sets_api.route('/cheapest/new/<x>')
-@redis_cache(module='sets', expire=60)
+@redis_cache(module='sets', expire=600, tags=('sets',))
 def get_cheapest_new_sets(x):
-    result = SET_OVERVIEWS_COLLECTION.find({"price": {"$ne": None}}).sort("price", 1).limit(int(x))
-    return jsonify(list(result))
+    return leaderboard('cheapest_new', x)
 
 @sets_api.route('/cheapest/used/<x>')
-@redis_cache(module='sets', expire=60)
+@redis_cache(module='sets', expire=600, tags=('sets',))
 def get_cheapest_used_sets(x):
-    pipeline = [
-        {
-            "$match": {
-                "min_offer": {
-                    "$exists": True
-                }
-            }
-        },
-        {
-            "$sort": {
-                "min_price": 1
-            }
-        },
-        {
-            "$limit": int(x)
-        }
-    ]
-
-    top_sets = list(SET_OVERVIEWS_COLLECTION.aggregate(pipeline))
-    return top_sets
+    return leaderboard('cheapest_used', x)
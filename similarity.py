@@ -0,0 +1,102 @@
+from imports import *
+from pymongo import UpdateOne, ReplaceOne
+from minhash import set_tokens, signature, bands
+from indexes import ensure_indexes
+
+# LSH band keys of every set, queried through a multikey index on "bands"
+SET_LSH_COLLECTION = DB['set_lsh']
+SET_CONTENTS_COLLECTION = DB['set_contents']
+SET_SIMILARITIES_COLLECTION = DB['set_similiarities']
+
+def set_bands(parts):
+    return bands(signature(set_tokens(parts)))
+
+def similarity_score(parts, other_parts):
+    """
+    Exact similarity of a set to another one: the share of the other set's
+    bricks that are also in this set, matched by part and color.
+    """
+    parts_in_common = 0
+    total_parts = 0
+    for part_id, other_part in other_parts.items():
+        total_parts += other_part['quantity']
+        part = parts.get(part_id)
+        if part and str(part['color']) == str(other_part['color']):
+            parts_in_common += min(part['quantity'], other_part['quantity'])
+    if not total_parts:
+        return 0
+    return round(parts_in_common / total_parts, 2)
+
+def candidates_find(set_id, bands):
+    """The other sets sharing at least one LSH band."""
+    return {"filter": {"bands": {"$in": list(bands)}, "_id": {"$ne": set_id}}, "projection": {"_id": 1}}
+
+def find_similar_sets(set_id, parts):
+    """
+    Score a set against the sets that share at least one LSH band with it.
+
+    Returns:
+        list: [(other_set_id, sim_score)] for every candidate with a non-zero score.
+    """
+    candidates = [doc['_id'] for doc in SET_LSH_COLLECTION.find(**candidates_find(set_id, set_bands(parts)))]
+    if not candidates:
+        return []
+
+    sim_scores = []
+    for other_set_contents in SET_CONTENTS_COLLECTION.find({"_id": {"$in": candidates}}, {"parts": 1}):
+        sim_score = similarity_score(parts, other_set_contents.get('parts', {}))
+        if sim_score > 0:
+            sim_scores.append((other_set_contents['_id'], sim_score))
+    return sim_scores
+
+def push_similarities(set_id, sim_scores):
+    """
+    Add a set to the similarity lists of the sets it was scored against in one bulk write.
+
+    A previous score of the same set is pulled first, so re-imported sets are not listed twice.
+    """
+    if not sim_scores:
+        return
+    operations = []
+    for other_id, sim_score in sim_scores:
+        operations.append(UpdateOne({"_id": other_id}, {"$pull": {"sim_scores": {"_id": set_id}}}))
+        operations.append(UpdateOne({"_id": other_id}, {"$push": {"sim_scores": {"_id": set_id, "sim_score": sim_score}}}, upsert=True))
+    SET_SIMILARITIES_COLLECTION.bulk_write(operations, ordered=True)
+
+def index_set_bands(set_id, parts, session=None):
+    SET_LSH_COLLECTION.replace_one({"_id": set_id}, {"_id": set_id, "bands": set_bands(parts)}, upsert=True, session=session)
+
+def index_sets_bands(sets, batch_size=500):
+    """Store the LSH bands of many sets, given as {set_id: parts}, with bulk writes."""
+    operations = [
+        ReplaceOne({"_id": set_id}, {"_id": set_id, "bands": set_bands(parts)}, upsert=True)
+        for set_id, parts in sets.items()
+    ]
+    for start in range(0, len(operations), batch_size):
+        SET_LSH_COLLECTION.bulk_write(operations[start:start + batch_size], ordered=False)
+
+def unindex_set_bands(set_id, session=None):
+    SET_LSH_COLLECTION.delete_one({"_id": set_id}, session=session)
+
+def rebuild_index(batch_size=500):
+    """Compute the LSH bands of every set in set_contents."""
+    ensure_indexes(['set_lsh'])
+    operations = []
+    indexed = 0
+    for set_contents in SET_CONTENTS_COLLECTION.find({}, {"parts": 1}):
+        operations.append(ReplaceOne(
+            {"_id": set_contents['_id']},
+            {"_id": set_contents['_id'], "bands": set_bands(set_contents.get('parts', {}))},
+            upsert=True
+        ))
+        if len(operations) >= batch_size:
+            SET_LSH_COLLECTION.bulk_write(operations, ordered=False)
+            indexed += len(operations)
+            operations = []
+    if operations:
+        SET_LSH_COLLECTION.bulk_write(operations, ordered=False)
+        indexed += len(operations)
+    print(f'Indexed {indexed} sets')
+
+if __name__ == '__main__':
+    rebuild_index()
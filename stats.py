@@ -1,5 +1,8 @@
 from flask import Flask, Blueprint, jsonify
 from imports import *
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from color_registry import color_names
 
 stats_api = Blueprint('stats_api', __name__)
 
@@ -10,69 +13,84 @@ SET_OVERVIEWS_COLLECTION = DB['set_overviews']
 SET_CONTENTS_COLLECTION = DB['set_contents']
 SET_SIMILARITIES_COLLECTION = DB['set_similarities']
 SET_OFFERS_COLLECTION = DB['set_offers']
-
-#collor maping 
-def get_color_name_map():
-    """uptake all colors and map them {id: name}."""
-    return {str(color['_id']): color['name'] for color in COLORS_COLLECTION.find()} 
+STATS_SNAPSHOT_COLLECTION = DB['stats_snapshot']
+
+SNAPSHOT_ID = 'current'
+# Full recompute interval and how long dirty sections wait before being recomputed, in seconds
+STATS_REFRESH_INTERVAL = int(os.getenv('STATS_REFRESH_INTERVAL', 600))
+STATS_DIRTY_DELAY = int(os.getenv('STATS_DIRTY_DELAY', 30))
+STATS_REFRESH_LOCK = 'lock:stats:refresh'
+# Seconds a refresh may take before another worker is allowed to start one
+STATS_REFRESH_LOCK_TIMEOUT = int(os.getenv('STATS_REFRESH_LOCK_TIMEOUT', 600))
+_stats_refresher = None
+STATS_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix='stats')
+
+def _facet_value(facets, name, field=None, default=None):
+    """Return the single document (or one of its fields) produced by a $facet branch."""
+    docs = facets.get(name) or []
+    if not docs:
+        return default
+    return docs[0] if field is None else docs[0].get(field, default)
+
+def _least_and_most(sort_field):
+    """$facet branch stages picking both ends of a sorted stream in one pass."""
+    return [
+        {"$sort": {sort_field: 1}},
+        {"$group": {"_id": None, "least": {"$first": "$$ROOT"}, "most": {"$last": "$$ROOT"}}},
+    ]
+
+def num_parts_end_find(direction):
+    """The set with the most (-1) or the least (1) parts."""
+    return {"filter": {}, "projection": {"_id": 1, "name": 1, "num_parts": 1}, "sort": [("num_parts", direction)], "limit": 1}
 
 def get_set_statistics():
     statistics = {}
 
-    # Total number of sets
-    total_sets = SET_OVERVIEWS_COLLECTION.count_documents({})
-    # Number of sets with offers
-    sets_with_offers = SET_OFFERS_COLLECTION.count_documents({"offers": {"$exists": True, "$ne": []}})
-
-    # Set with the least number of offers
-    set_with_less_offers = next(SET_OFFERS_COLLECTION.aggregate([
-        {"$project": {"_id": 1, "num_offers": {"$size": "$offers"}}},
-        {"$sort": {"num_offers": 1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Set with the most number of offers
-    set_with_most_offers = next(SET_OFFERS_COLLECTION.aggregate([
-        {"$project": {"_id": 1, "num_offers": {"$size": "$offers"}}},
-        {"$sort": {"num_offers": -1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Most expensive set based on offers
-    most_expensive_set = next(SET_OFFERS_COLLECTION.aggregate([
-        {"$project": {"_id": 1, "max_price": {"$max": {"$map": {"input": "$offers", "as": "offer", "in": "$$offer.price"}}}}}, 
-        {"$sort": {"max_price": -1}}, 
-        {"$limit": 1}
-    ]), None)
-
-    # Least expensive set based on offers
-    less_expensive_set = next(SET_OFFERS_COLLECTION.aggregate([
-        {"$project": {"_id": 1, "max_price": {"$max": {"$map": {"input": "$offers", "as": "offer", "in": "$$offer.price"}}}}}, 
-        {"$sort": {"max_price": 1}}, 
-        {"$limit": 1}
-    ]), None)
-
-    # Average number of parts per set
-    average_parts_result = SET_OVERVIEWS_COLLECTION.aggregate([{
-        '$group': {'_id': None, 'average_parts_per_set': {'$avg': '$num_parts'}}
-    }])
-    average_parts_per_set = round(next(average_parts_result, {}).get('average_parts_per_set', 0), 2)
-
-    # Set with the most parts
-    sets_with_the_most_parts = next(SET_OVERVIEWS_COLLECTION.find({}, {'_id': 1, 'name': 1, 'num_parts': 1}).sort('num_parts', -1).limit(1), None)
-    # Set with the least parts
-    sets_with_the_less_parts = next(SET_OVERVIEWS_COLLECTION.find({}, {'_id': 1, 'name': 1, 'num_parts': 1}).sort('num_parts', 1).limit(1), None)
+    # One scan over the overviews for the count and the average number of parts
+    overviews = next(SET_OVERVIEWS_COLLECTION.aggregate([
+        {"$project": {"_id": 1, "num_parts": 1}},
+        {"$facet": {
+            # Total number of sets
+            "total_sets": [{"$count": "count"}],
+            # Average number of parts per set
+            "average_parts": [{"$group": {"_id": None, "average_parts_per_set": {"$avg": "$num_parts"}}}],
+        }}
+    ]), {})
+    # Sets with the most and the least parts, both ends of the num_parts index
+    most_parts = next(SET_OVERVIEWS_COLLECTION.find(**num_parts_end_find(-1)), None)
+    least_parts = next(SET_OVERVIEWS_COLLECTION.find(**num_parts_end_find(1)), None)
+
+    # One scan over the offers for everything based on offer counts and prices
+    offers = next(SET_OFFERS_COLLECTION.aggregate([
+        {"$project": {
+            "_id": 1,
+            "num_offers": {"$size": {"$ifNull": ["$offers", []]}},
+            "max_price": {"$max": {"$map": {"input": "$offers", "as": "offer", "in": "$$offer.price"}}}
+        }},
+        {"$facet": {
+            # Number of sets with offers
+            "sets_with_offers": [{"$match": {"num_offers": {"$gt": 0}}}, {"$count": "count"}],
+            # Sets with the least and the most offers
+            "offers": [{"$project": {"max_price": 0}}] + _least_and_most("num_offers"),
+            # Least and most expensive sets based on offers
+            "prices": [{"$project": {"num_offers": 0}}] + _least_and_most("max_price"),
+        }}
+    ]), {})
+
+    average_parts_per_set = _facet_value(overviews, "average_parts", "average_parts_per_set") or 0
+    num_offers = _facet_value(offers, "offers", default={})
+    prices = _facet_value(offers, "prices", default={})
 
     statistics['sets'] = {
-        "total_sets": total_sets,
-        "sets_with_offers": sets_with_offers,
-        "average_parts_per_set": average_parts_per_set,
-        "sets_with_the_most_parts": sets_with_the_most_parts,
-        "sets_with_the_less_parts": sets_with_the_less_parts,
-        "set_with_less_offers": set_with_less_offers,
-        "set_with_most_offers": set_with_most_offers,
-        "most_expensive_set": most_expensive_set,
-        "less_expensive_set": less_expensive_set
+        "total_sets": _facet_value(overviews, "total_sets", "count", 0),
+        "sets_with_offers": _facet_value(offers, "sets_with_offers", "count", 0),
+        "average_parts_per_set": round(average_parts_per_set, 2),
+        "sets_with_the_most_parts": most_parts,
+        "sets_with_the_less_parts": least_parts,
+        "set_with_less_offers": num_offers.get("least"),
+        "set_with_most_offers": num_offers.get("most"),
+        "most_expensive_set": prices.get("most"),
+        "less_expensive_set": prices.get("least")
     }
 
     return statistics
@@ -80,85 +98,61 @@ def get_set_statistics():
 
 def get_part_statistics():
     statistics = {}
-
-    # Total number of parts
-    total_parts = PARTS_COLLECTION.count_documents({})
-
-    # Distribution of colors among parts
-    color_name_map = get_color_name_map()
-    color_counts = PARTS_COLLECTION.aggregate([
-        {"$project": {"colors": {"$objectToArray": "$colors"}}},
-        {"$unwind": "$colors"},
-        {"$group": {"_id": "$colors.k", "count": {"$sum": {"$size": "$colors.v"}}}}
-    ])
-    colors_distribution = {color_name_map.get(doc["_id"], "Unknown"): doc["count"] for doc in color_counts}
-
-    # Part with the most offers
-    part_with_most_offers = next(PARTS_COLLECTION.aggregate([
-        {"$project": {"_id": 1, "num_offers": {"$sum": [{"$size": {"$ifNull": [{"$objectToArray": "$colors"}, []]}}]}}},
-        {"$sort": {"num_offers": -1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Part with the least offers
-    part_with_less_offers = next(PARTS_COLLECTION.aggregate([
-        {"$project": {"_id": 1, "num_offers": {"$sum": [{"$size": {"$ifNull": [{"$objectToArray": "$colors"}, []]}}]}}},
-        {"$sort": {"num_offers": 1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Cheapest part based on offers
-
-
-    cheapest_part = next(PARTS_COLLECTION.aggregate([
-    {"$project": {
-        "_id": 1,
-        "min_offer": {
-            "$min": {
-                "$filter": {
-                    "input": {
-                        "$map": {
-                            "input": {"$objectToArray": "$colors"},
-                            "as": "color",
-                            "in": {
-                                "$min": {
-                                    "$map": {
-                                        "input": "$$color.v",  # Offers for the color
-                                        "as": "offer",
-                                        "in": "$$offer.Price"
-                                    }
-                                }
-                            }
-                        }
-                    },
-                    "as": "price",
-                    "cond": {"$ne": ["$$price", None]}  # Filter out None values
-                }
-            }
-        }
-    }},
-     {"$match": {"min_offer": {"$gt": 0}}},  # Ensure we exclude 0 as a price
-     {"$sort": {"min_offer": 1}},  # Sort by the min_offer in ascending order
-     {"$limit": 1}  # Limit to only one result
-    ]), None)
-
+    color_name_map = color_names()
+
+    # One scan over the parts, reading the stored price summaries instead of the offers
+    facets = next(PARTS_COLLECTION.aggregate([
+        {"$project": {
+            "_id": 1,
+            "colors": {"$map": {
+                "input": {"$objectToArray": {"$ifNull": ["$price_summary.colors", {}]}},
+                "as": "color",
+                "in": {"k": "$$color.k", "count": "$$color.v.offer_count"}
+            }},
+            "min_offer": "$price_summary.min_price",
+            "max_price": "$price_summary.max_price"
+        }},
+        {"$addFields": {"num_offers": {"$size": "$colors"}}},
+        {"$facet": {
+            # Total number of parts
+            "total_parts": [{"$count": "count"}],
+            # Distribution of colors among parts
+            "colors_distribution": [
+                {"$unwind": "$colors"},
+                {"$group": {"_id": "$colors.k", "count": {"$sum": "$colors.count"}}}
+            ],
+            # Parts with the least and the most offers
+            "offers": [{"$project": {"_id": 1, "num_offers": 1}}] + _least_and_most("num_offers"),
+            # Cheapest part based on offers, 0 is not a real price
+            "cheapest_part": [
+                {"$match": {"min_offer": {"$gt": 0}}},
+                {"$sort": {"min_offer": 1}},
+                {"$limit": 1},
+                {"$project": {"_id": 1, "min_offer": 1}}
+            ],
+            # Most expensive part based on offers
+            "most_expensive_part": [
+                {"$sort": {"max_price": -1}},
+                {"$limit": 1},
+                {"$project": {"_id": 1, "max_price": 1}}
+            ],
+        }}
+    ]), {})
+
+    colors_distribution = {color_name_map.get(doc["_id"], "Unknown"): doc["count"] for doc in facets.get("colors_distribution", [])}
+    num_offers = _facet_value(facets, "offers", default={})
+
+    cheapest_part = _facet_value(facets, "cheapest_part")
     if cheapest_part:
        cheapest_part["_id"] = str(cheapest_part["_id"])
 
-    # Most expensive part based on offers
-    most_expensive_part = next(PARTS_COLLECTION.aggregate([
-        {"$project": {"_id": 1, "max_price": {"$max": {"$map": {"input": {"$objectToArray": "$colors"}, "as": "color", "in": {"$max": {"$map": {"input": "$$color.v", "as": "offer", "in": "$$offer.Price"}}}}}}}},
-        {"$sort": {"max_price": -1}},
-        {"$limit": 1}
-    ]), None)
-
     statistics['parts'] = {
-        "total_parts": total_parts,
+        "total_parts": _facet_value(facets, "total_parts", "count", 0),
         "colors_distribution": colors_distribution,
-        "part_with_less_offers": part_with_less_offers,
-        "part_with_most_offers": part_with_most_offers,
+        "part_with_less_offers": num_offers.get("least"),
+        "part_with_most_offers": num_offers.get("most"),
         "cheapest_part": cheapest_part,
-        "most_expensive_part": most_expensive_part
+        "most_expensive_part": _facet_value(facets, "most_expensive_part")
     }
 
     return statistics
@@ -166,113 +160,179 @@ def get_part_statistics():
 def get_user_statistics():
     statistics = {}
 
-    # Total number of users
-    total_users = USERS_COLLECTION.count_documents({})
-    # Number of users with sets in their inventory
-    users_with_sets = USERS_COLLECTION.count_documents({"inventory.sets": {"$exists": True, "$ne": []}})
-    # Number of users with parts in their inventory
-    users_with_parts = USERS_COLLECTION.count_documents({"inventory.parts": {"$exists": True, "$ne": []}})
-
-    # User with the most parts
-    user_with_most_parts = next(USERS_COLLECTION.aggregate([
-        {"$project": {"parts": {"$objectToArray": "$inventory.parts"}}},
-        {"$unwind": "$parts"},
-        {"$project": {"part_values": {"$objectToArray": "$parts.v"}}},
-        {"$unwind": "$part_values"},
-        {"$group": {"_id": "$_id", "num_parts": {"$sum": {"$toInt": "$part_values.v"}}}},
-        {"$sort": {"num_parts": -1}},
-        {"$limit": 1}
-    ]), None)
-
-    # User with the least parts
-    user_with_less_parts = next(USERS_COLLECTION.aggregate([
-        {"$project": {"parts": {"$objectToArray": "$inventory.parts"}}},
-        {"$unwind": "$parts"},
-        {"$project": {"part_values": {"$objectToArray": "$parts.v"}}},
-        {"$unwind": "$part_values"},
-        {"$group": {"_id": "$_id", "num_parts": {"$sum": {"$toInt": "$part_values.v"}}}},
-        {"$sort": {"num_parts": 1}},
-        {"$limit": 1}
-    ]), None)
-
-    # User with the most sets
-    user_with_most_sets = next(USERS_COLLECTION.aggregate([
-        {"$project": {"sets": {"$objectToArray": "$inventory.sets"}}},
-        {"$unwind": "$sets"},
-        {"$project": {"set_id": "$sets.k"}},
-        {"$group": {"_id": "$_id", "unique_sets": {"$addToSet": "$set_id"}}},
-        {"$project": {"_id": 1, "num_sets": {"$size": "$unique_sets"}}},
-        {"$sort": {"num_sets": -1}},
-        {"$limit": 1}
-    ]), None)
-
-    # User with the least sets
-    user_with_less_sets = next(USERS_COLLECTION.aggregate([
-        {"$project": {"sets": {"$objectToArray": "$inventory.sets"}}},
-        {"$unwind": "$sets"},
-        {"$project": {"set_id": "$sets.k"}},
-        {"$group": {"_id": "$_id", "unique_sets": {"$addToSet": "$set_id"}}},
-        {"$project": {"_id": 1, "num_sets": {"$size": "$unique_sets"}}},
-        {"$sort": {"num_sets": 1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Most frequent part in users' inventories
-    most_frequent_part = next(USERS_COLLECTION.aggregate([
-        {"$project": {"parts": {"$objectToArray": "$inventory.parts"}}},
-        {"$unwind": "$parts"},
-        {"$group": {"_id": "$parts.k", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Least frequent part in users' inventories
-    less_frequent_part = next(USERS_COLLECTION.aggregate([
-        {"$project": {"parts": {"$objectToArray": "$inventory.parts"}}},
-        {"$unwind": "$parts"},
-        {"$group": {"_id": "$parts.k", "count": {"$sum": 1}}},
-        {"$sort": {"count": 1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Most frequent set in users' inventories
-    most_frequent_set = next(USERS_COLLECTION.aggregate([
-        {"$project": {"sets": {"$objectToArray": "$inventory.sets"}}},
-        {"$unwind": "$sets"},
-        {"$group": {"_id": "$sets.k", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 1}
-    ]), None)
-
-    # Least frequent set in users' inventories
-    less_frequent_set = next(USERS_COLLECTION.aggregate([
-        {"$project": {"sets": {"$objectToArray": "$inventory.sets"}}},
-        {"$unwind": "$sets"},
-        {"$group": {"_id": "$sets.k", "count": {"$sum": 1}}},
-        {"$sort": {"count": 1}},
-        {"$limit": 1}
-    ]), None)
+    # One scan over the users, inventories are turned into arrays once
+    facets = next(USERS_COLLECTION.aggregate([
+        {"$project": {
+            "_id": 1,
+            "has_sets": {"$ne": [{"$type": "$inventory.sets"}, "missing"]},
+            "has_parts": {"$ne": [{"$type": "$inventory.parts"}, "missing"]},
+            "parts": {"$ifNull": [{"$objectToArray": "$inventory.parts"}, []]},
+            "sets": {"$ifNull": [{"$objectToArray": "$inventory.sets"}, []]}
+        }},
+        {"$facet": {
+            # Total number of users
+            "total_users": [{"$count": "count"}],
+            # Number of users with sets in their inventory
+            "users_with_sets": [{"$match": {"has_sets": True}}, {"$count": "count"}],
+            # Number of users with parts in their inventory
+            "users_with_parts": [{"$match": {"has_parts": True}}, {"$count": "count"}],
+            # Users with the most and the least parts
+            "parts_per_user": [
+                {"$unwind": "$parts"},
+                {"$project": {"part_values": {"$objectToArray": "$parts.v"}}},
+                {"$unwind": "$part_values"},
+                {"$group": {"_id": "$_id", "num_parts": {"$sum": {"$toInt": "$part_values.v"}}}}
+            ] + _least_and_most("num_parts"),
+            # Users with the most and the least sets
+            "sets_per_user": [
+                {"$project": {"_id": 1, "num_sets": {"$size": "$sets"}}},
+                {"$match": {"num_sets": {"$gt": 0}}}
+            ] + _least_and_most("num_sets"),
+            # Most and least frequent parts in users' inventories
+            "part_frequency": [
+                {"$unwind": "$parts"},
+                {"$group": {"_id": "$parts.k", "count": {"$sum": 1}}}
+            ] + _least_and_most("count"),
+            # Most and least frequent sets in users' inventories
+            "set_frequency": [
+                {"$unwind": "$sets"},
+                {"$group": {"_id": "$sets.k", "count": {"$sum": 1}}}
+            ] + _least_and_most("count"),
+        }}
+    ], allowDiskUse=True), {})
+
+    parts_per_user = _facet_value(facets, "parts_per_user", default={})
+    sets_per_user = _facet_value(facets, "sets_per_user", default={})
+    part_frequency = _facet_value(facets, "part_frequency", default={})
+    set_frequency = _facet_value(facets, "set_frequency", default={})
 
     statistics['users'] = {
-        "total_users": total_users,
-        "users_with_sets": users_with_sets,
-        "users_with_parts": users_with_parts,
-        "user_with_most_parts": user_with_most_parts,
-        "user_with_less_parts": user_with_less_parts,
-        "user_with_most_sets": user_with_most_sets,
-        "user_with_less_sets": user_with_less_sets,
-        "most_frequent_part": most_frequent_part,
-        "less_frequent_part": less_frequent_part,
-        "most_frequent_set": most_frequent_set,
-        "less_frequent_set": less_frequent_set
+        "total_users": _facet_value(facets, "total_users", "count", 0),
+        "users_with_sets": _facet_value(facets, "users_with_sets", "count", 0),
+        "users_with_parts": _facet_value(facets, "users_with_parts", "count", 0),
+        "user_with_most_parts": parts_per_user.get("most"),
+        "user_with_less_parts": parts_per_user.get("least"),
+        "user_with_most_sets": sets_per_user.get("most"),
+        "user_with_less_sets": sets_per_user.get("least"),
+        "most_frequent_part": part_frequency.get("most"),
+        "less_frequent_part": part_frequency.get("least"),
+        "most_frequent_set": set_frequency.get("most"),
+        "less_frequent_set": set_frequency.get("least")
     }
 
     return statistics
 
+SECTIONS = {
+    'sets': get_set_statistics,
+    'parts': get_part_statistics,
+    'users': get_user_statistics,
+}
+
+def refresh_statistics(sections=None):
+    """
+    Recompute statistics sections and store them in the snapshot document.
+    Sections changed while they were computed stay dirty.
+
+    Args:
+        sections (iterable): Section names to recompute, all of them by default.
+
+    Returns:
+        dict: The recomputed sections.
+    """
+    sections = list(sections or SECTIONS)
+    # Dirty marks written while the sections are computed must survive the refresh
+    seen = (STATS_SNAPSHOT_COLLECTION.find_one({"_id": SNAPSHOT_ID}, {"dirty": 1}) or {}).get('dirty', {})
+    statistics = {}
+    update = {}
+    # Each section scans different collections, so they run side by side
+    futures = {section: STATS_EXECUTOR.submit(SECTIONS[section]) for section in sections}
+    for section, future in futures.items():
+        statistics.update(future.result())
+        update[section] = statistics[section]
+        update[f'computed_at.{section}'] = datetime.datetime.now(datetime.timezone.utc)
+    STATS_SNAPSHOT_COLLECTION.update_one({"_id": SNAPSHOT_ID}, {"$set": update}, upsert=True)
+    for section in sections:
+        if section in seen:
+            # A newer mark (or counter change) leaves the section dirty for the next refresh
+            STATS_SNAPSHOT_COLLECTION.update_one({"_id": SNAPSHOT_ID, f'dirty.{section}': seen[section]}, {"$unset": {f'dirty.{section}': ''}})
+    return statistics
+
+def record_stats_change(section, **counters):
+    """
+    Apply a write to the statistics snapshot.
+
+    Counters such as total_sets are adjusted in place right away, the rest of
+    the section is marked dirty and recomputed by the background refresher.
+
+    Args:
+        section (str): 'sets', 'parts' or 'users'.
+        counters (int): Deltas for counters of the section, e.g. total_sets=1.
+    """
+    # Every change gets its own mark, so a refresh only clears the marks it has seen
+    update = {"$set": {f'dirty.{section}': uuid.uuid4().hex}}
+    if counters:
+        update["$inc"] = {f'{section}.{name}': delta for name, delta in counters.items()}
+    try:
+        STATS_SNAPSHOT_COLLECTION.update_one({"_id": SNAPSHOT_ID}, update)
+    except Exception as e:
+        # The snapshot is derived data, a failed update must not fail the write itself
+        print('Failed to update stats snapshot:', e)
+
+def _refresh_due_sections():
+    snapshot = STATS_SNAPSHOT_COLLECTION.find_one({"_id": SNAPSHOT_ID}, {"dirty": 1, "computed_at": 1}) or {}
+    now = datetime.datetime.now(datetime.timezone.utc)
+    computed_at = snapshot.get('computed_at', {})
+    due = []
+    for section in SECTIONS:
+        last = computed_at.get(section)
+        if last is not None and last.tzinfo is None:
+            last = last.replace(tzinfo=datetime.timezone.utc)
+        age = (now - last).total_seconds() if last else None
+        if age is None or age >= STATS_REFRESH_INTERVAL:
+            due.append(section)
+        elif snapshot.get('dirty', {}).get(section) and age >= STATS_DIRTY_DELAY:
+            due.append(section)
+    if due:
+        refresh_statistics(due)
+
+def _run_stats_refresher():
+    while True:
+        try:
+            # Only one worker recomputes at a time, the lock is released as soon as it is done
+            token = uuid.uuid4().hex
+            if REDIS.set(STATS_REFRESH_LOCK, token, nx=True, ex=STATS_REFRESH_LOCK_TIMEOUT):
+                try:
+                    _refresh_due_sections()
+                finally:
+                    release_lock(STATS_REFRESH_LOCK, token)
+        except Exception as e:
+            print('Stats refresh failed:', e)
+        time.sleep(STATS_DIRTY_DELAY)
+
+def start_stats_refresher():
+    """Start the background thread that keeps the statistics snapshot up to date."""
+    global _stats_refresher
+    if _stats_refresher is None:
+        _stats_refresher = threading.Thread(target=_run_stats_refresher, daemon=True)
+        _stats_refresher.start()
+
+def _load_snapshot(sections):
+    snapshot = STATS_SNAPSHOT_COLLECTION.find_one({"_id": SNAPSHOT_ID}, {section: 1 for section in sections} | {"computed_at": 1})
+    missing = [section for section in sections if not snapshot or section not in snapshot]
+    if missing:
+        refresh_statistics(missing)
+        snapshot = STATS_SNAPSHOT_COLLECTION.find_one({"_id": SNAPSHOT_ID}, {section: 1 for section in sections} | {"computed_at": 1})
+
+    statistics = {section: snapshot[section] for section in sections}
+    statistics['computed_at'] = min(snapshot['computed_at'][section] for section in sections).isoformat()
+    return statistics
+
 @stats_api.route('', methods=['GET'])
 def database_statistics():
-    statistics = {}
-    statistics.update(get_set_statistics())
-    statistics.update(get_part_statistics())
-    statistics.update(get_user_statistics())
-    return jsonify(statistics)
+    return jsonify(_load_snapshot(list(SECTIONS)))
+
+@stats_api.route('/<section>', methods=['GET'])
+def section_statistics(section):
+    if section not in SECTIONS:
+        return jsonify({'error': f'Unknown statistics section "{section}".'}), 404
+    return jsonify(_load_snapshot([section]))
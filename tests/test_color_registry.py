@@ -0,0 +1,27 @@
+import pytest
+
+redis = pytest.importorskip("redis")
+pytest.importorskip("pymongo")
+import color_registry
+from imports import REDIS
+
+# The registry against the configured Redis (REDIS_HOST/REDIS_PORT)
+
+@pytest.fixture
+def cold_registry():
+    try:
+        REDIS.ping()
+    except redis.exceptions.RedisError:
+        pytest.skip('no Redis server reachable')
+    color_registry.reset()
+    yield
+    color_registry.reset()
+
+def test_registry_loads_from_scratch(cold_registry):
+    names = color_registry.color_names()
+    assert isinstance(names, dict)
+    for color_id, name in names.items():
+        assert color_registry.find_color_id(color_id) == color_id
+        assert color_registry.find_color_id(name.upper()) is not None
+        assert color_registry.color_name(color_id) == name
+    assert color_registry.find_color_id('no such color') is None
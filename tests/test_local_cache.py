@@ -0,0 +1,53 @@
+import time
+from local_cache import LocalCache
+
+
+def test_get_returns_stored_value():
+    cache = LocalCache()
+    cache.set('a', 'value', ttl=60)
+    assert cache.get('a') == 'value'
+    assert cache.get('missing') is None
+
+def test_entry_expires_after_ttl():
+    cache = LocalCache()
+    cache.set('a', 'value', ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+def test_evicts_least_recently_used_entry():
+    cache = LocalCache(max_entries=2)
+    cache.set('a', '1', ttl=60)
+    cache.set('b', '2', ttl=60)
+    cache.get('a')
+    cache.set('c', '3', ttl=60)
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+
+def test_respects_byte_limit():
+    cache = LocalCache(max_bytes=10)
+    cache.set('a', 'x' * 6, ttl=60)
+    cache.set('b', 'y' * 6, ttl=60)
+    assert cache.get('a') is None
+    assert cache.size_bytes == 6
+    cache.set('big', 'z' * 11, ttl=60)
+    assert cache.get('big') is None
+
+def test_stats_are_reported_per_module():
+    cache = LocalCache()
+    cache.record('parts', 'local_hits')
+    cache.record('parts', 'misses')
+    cache.record('sets', 'redis_hits')
+    modules = cache.stats()['modules']
+    assert modules['parts'] == {'local_hits': 1, 'redis_hits': 0, 'stale_hits': 0, 'misses': 1}
+    assert modules['sets']['redis_hits'] == 1
+
+def test_invalidate_tags_drops_tagged_entries_only():
+    cache = LocalCache()
+    cache.set('part', '1', ttl=60, tags=('part:1', 'parts'))
+    cache.set('set', '2', ttl=60, tags=('set:1',))
+    cache.invalidate_tags(['parts'])
+    assert cache.get('part') is None
+    assert cache.get('set') == '2'
+    assert cache.size_bytes == 1
@@ -0,0 +1,23 @@
+from minhash import set_tokens, signature, bands, estimate_similarity, BANDS
+
+
+def _parts(n, offset=0):
+    return {str(i + offset): {'color': 4, 'quantity': 2} for i in range(n)}
+
+def test_tokens_expand_quantities():
+    tokens = set_tokens({'3001': {'color': 4, 'quantity': 3}})
+    assert tokens == ['3001|4|0', '3001|4|1', '3001|4|2']
+
+def test_identical_sets_share_every_band():
+    sig = signature(set_tokens(_parts(50)))
+    assert sig == signature(set_tokens(_parts(50)))
+    assert len(bands(sig)) == BANDS
+    assert estimate_similarity(sig, sig) == 1.0
+
+def test_similar_sets_are_candidates_and_disjoint_sets_are_not():
+    base = signature(set_tokens(_parts(100)))
+    similar = signature(set_tokens(_parts(100, offset=10)))
+    disjoint = signature(set_tokens(_parts(100, offset=1000)))
+    assert set(bands(base)) & set(bands(similar))
+    assert not set(bands(base)) & set(bands(disjoint))
+    assert estimate_similarity(base, similar) > estimate_similarity(base, disjoint)
@@ -0,0 +1,53 @@
+from part_colors import (colors_to_dict, colors_for_storage, has_color_filter, parts_by_color_pipeline,
+                         push_offers_update, pull_offers_updates)
+
+
+OFFERS = [{'Link': 'a', 'Price': 0.1, 'Quantity': 5}]
+
+def test_both_layouts_read_the_same():
+    stored = [{'color_id': '4', 'offers': OFFERS}, {'color_id': '1', 'offers': []}]
+    assert colors_to_dict(stored) == {'4': OFFERS, '1': []}
+    assert colors_to_dict({'4': OFFERS, '1': []}) == {'4': OFFERS, '1': []}
+    assert colors_to_dict(None) == {}
+
+def test_storage_round_trip():
+    colors = {'4': OFFERS, '1': []}
+    assert colors_for_storage(colors, layout='object') == colors
+    stored = colors_for_storage(colors, layout='array')
+    assert stored == [{'color_id': '4', 'offers': OFFERS}, {'color_id': '1', 'offers': []}]
+    assert colors_to_dict(stored) == colors
+    assert colors_for_storage(stored, layout='migrating') == stored
+
+def test_color_filter_per_layout():
+    assert has_color_filter(4, layout='object') == {'colors.4': {'$exists': True}}
+    assert has_color_filter(4, layout='array') == {'colors.color_id': '4'}
+    # Object paths must not match array positions while both layouts exist
+    migrating = has_color_filter(4, layout='migrating')['$or']
+    assert {'colors.color_id': '4'} in migrating
+    object_branch = next(branch for branch in migrating if 'colors.4' in branch)
+    # The query $type matches arrays of objects, the layout check must use the aggregation $type
+    assert 'colors' not in object_branch
+    assert object_branch['$expr'] == {'$eq': [{'$type': '$colors'}, 'object']}
+
+def test_parts_by_color_pipeline_is_limited():
+    pipeline = parts_by_color_pipeline('4', '25', layout='array')
+    assert pipeline[0] == {'$match': {'colors.color_id': '4'}}
+    assert pipeline[-1] == {'$limit': 25}
+
+def test_push_offers_keeps_lists_sorted_in_both_layouts():
+    update, array_filters = push_offers_update({'4': OFFERS}, layout='object')
+    assert update == {'$push': {'colors.4': {'$each': OFFERS, '$sort': {'Price': 1}}}}
+    assert array_filters is None
+    update, array_filters = push_offers_update({'4': OFFERS, '1': OFFERS}, layout='array')
+    assert set(update['$push']) == {'colors.$[c0].offers', 'colors.$[c1].offers'}
+    assert array_filters == [{'c0.color_id': '4'}, {'c1.color_id': '1'}]
+
+def test_pull_offers_only_targets_parts_having_the_color():
+    condition = {'Link': 'a'}
+    assert pull_offers_updates('4', condition, layout='object') == [
+        ({'colors.4': {'$exists': True}}, {'$pull': {'colors.4': condition}}, None)
+    ]
+    assert pull_offers_updates('4', condition, layout='array') == [
+        ({'colors.color_id': '4'}, {'$pull': {'colors.$[color].offers': condition}}, [{'color.color_id': '4'}])
+    ]
+    assert len(pull_offers_updates('4', condition, layout='migrating')) == 2
@@ -0,0 +1,119 @@
+import os
+import pytest
+
+pymongo = pytest.importorskip("pymongo")
+indexes = pytest.importorskip("indexes")
+parts = pytest.importorskip("parts")
+import imports
+import part_index
+import similarity
+import stats
+import part_colors
+
+# Query plans of the route queries against the declared indexes, on a local
+# mongod (MONGO_TEST_URI). A plan with a collection scan or an in-memory sort
+# means a query is missing its index.
+MONGO_TEST_URI = os.getenv('MONGO_TEST_URI', 'mongodb://localhost:27017')
+BAD_STAGES = {'COLLSCAN', 'SORT'}
+
+@pytest.fixture(scope='module')
+def db():
+    client = pymongo.MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        pytest.skip(f'no mongod at {MONGO_TEST_URI}')
+    db = client['bricks_query_plans']
+    client.drop_database(db.name)
+    # The planner only considers indexes of collections that exist
+    for name in indexes.INDEXES:
+        db[name].insert_one({})
+    for name in ('users', 'set_contents', 'set_offers'):
+        db[name].insert_one({})
+    indexes.ensure_indexes(db=db)
+    yield db
+    client.drop_database(db.name)
+
+def plan_stages(plan):
+    """Every stage name of a winning plan tree."""
+    stages = set()
+    if isinstance(plan, dict):
+        if isinstance(plan.get('stage'), str):
+            stages.add(plan['stage'])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= plan_stages(value)
+    return stages
+
+def explain_stages(explained):
+    """
+    The stages of the winning plans of an explain output, and SORT for a
+    blocking $sort left in the aggregation stages. The echoed command is not
+    read, its $sort may well have been answered by an index.
+    """
+    stages = plan_stages(explained.get('queryPlanner', {}).get('winningPlan'))
+    for stage in explained.get('stages', []):
+        stages |= plan_stages(stage.get('$cursor', {}).get('queryPlanner', {}).get('winningPlan'))
+        if '$sort' in stage:
+            stages.add('SORT')
+    assert stages, 'no winning plan in the explain output'
+    return stages
+
+def explain_find(db, collection, find):
+    command = {'find': collection, 'filter': find['filter']}
+    if find.get('projection'):
+        command['projection'] = find['projection']
+    if find.get('sort'):
+        command['sort'] = dict(find['sort'])
+    if find.get('limit'):
+        command['limit'] = find['limit']
+    return db.command('explain', command, verbosity='queryPlanner')
+
+def explain_aggregate(db, collection, pipeline):
+    return db.command('explain', {'aggregate': collection, 'pipeline': pipeline, 'cursor': {}}, verbosity='queryPlanner')
+
+# The find() arguments the routes build, from their own query builders
+FIND_QUERIES = {
+    'parts detail': ('parts', imports.by_id_find('3001')),
+    'parts by id for valuation': ('parts', imports.by_ids_find(['3001', '3003'], {'colors.4': 1})),
+    'part sets by color': ('part_set_index', part_index.part_sets_find('3001', '4')),
+    'part sets': ('part_set_index', part_index.part_sets_find('3001')),
+    'set completion': ('part_set_index', part_index.completion_find(['3001|4', '3003|1'])),
+    'sets listing': ('set_overviews', imports.listing_find(None, limit=25)),
+    'sets listing page': ('set_overviews', imports.listing_find('10001-1', limit=25)),
+    'sets detail': ('set_overviews', imports.by_id_find('10001-1')),
+    # popular and leaderboard sets: ids ranked in Redis, overviews fetched at once
+    'ranked sets': ('set_overviews', imports.by_ids_find(['10001-1', '10002-1'])),
+    'stats most parts': ('set_overviews', stats.num_parts_end_find(-1)),
+    'stats least parts': ('set_overviews', stats.num_parts_end_find(1)),
+    'similar set candidates': ('set_lsh', similarity.candidates_find('10001-1', ['0:ab', '1:cd'])),
+    'users listing': ('users', imports.listing_find('alice', limit=25)),
+}
+
+@pytest.mark.parametrize('name', FIND_QUERIES)
+def test_find_plans(db, name):
+    collection, find = FIND_QUERIES[name]
+    assert not explain_stages(explain_find(db, collection, find)) & BAD_STAGES
+
+AGGREGATIONS = {
+    'parts listing': ('parts', parts.part_listing_pipeline(None, limit=25)),
+    'parts listing page': ('parts', parts.part_listing_pipeline('3001', {'_id': 1, 'colors': 1}, 25)),
+    'parts by color': ('parts', part_colors.parts_by_color_pipeline('4', 25, layout='array')),
+}
+
+@pytest.mark.parametrize('collection, pipeline', AGGREGATIONS.values(), ids=list(AGGREGATIONS))
+def test_aggregation_plans(db, collection, pipeline):
+    assert not explain_stages(explain_aggregate(db, collection, pipeline)) & BAD_STAGES
+
+def test_migrating_color_filter_skips_array_positions(db):
+    # colors.4 is the fifth entry of an array, the object branch must not match it
+    parts = db['parts_layouts']
+    parts.insert_many([
+        {'_id': 'array', 'colors': [{'color_id': str(color_id), 'offers': []} for color_id in range(10, 16)]},
+        {'_id': 'array with 4', 'colors': [{'color_id': '4', 'offers': []}]},
+        {'_id': 'object with 4', 'colors': {'4': []}},
+    ])
+    found = {part['_id'] for part in parts.aggregate(part_colors.parts_by_color_pipeline('4', 25, layout='migrating'))}
+    assert found == {'array with 4', 'object with 4'}
@@ -4,6 +4,8 @@ from mongomock import Database, MongoClient
 from stats import stats_api, get_set_statistics, get_part_statistics, get_user_statistics
 from parts import parts_api, get_parts
 from sets import sets_api, get_set, get_profitable_sets,get_cheapest_new_sets, get_cheapest_used_sets
+import jwt
+from imports import LOCAL_CACHE
 from user import users_api, get_users,get_user_inventory,most_expensive_part, total_value_of_owned_parts,set_completed_percentage,find_cheapest_from_inventory
 
 @pytest.fixture
@@ -155,15 +157,12 @@ def test_find_cheapest_from_inventory(client):
         assert 'completion_percentage' in item
         assert 'set_id' in item
 
-
-
-
-
-
-
-
-
-
-
-
-
+def test_authenticated_request_with_cold_principal_cache(app, client, mock_db, monkeypatch):
+    monkeypatch.setattr('user.USERS_COLLECTION', mock_db['users'])
+    mock_db['users'].insert_one({'_id': 'alice', 'password': 'secret', 'token_version': 0})
+    app.config['SECRET_KEY'] = 'test-secret'
+    LOCAL_CACHE.clear()
+    token = jwt.encode({'_id': 'alice', 'ver': 0}, 'test-secret', algorithm='HS256')
+    response = client.get('/users/alice', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.get_json()[0]['_id'] == 'alice'
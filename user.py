@@ -1,8 +1,14 @@
 from imports import *
+from imports import _start_invalidation_listener
 import jwt
 import datetime
 from flask import current_app, jsonify, request
 from functools import wraps
+from stats import record_stats_change
+from part_index import set_completion
+from valuation import value_parts, PRICING_POLICIES
+from pymongo import UpdateOne
+from pymongo.errors import WriteError
 
 users_api = Blueprint('users_api', __name__)
 USERS_COLLECTION = DB['users']
@@ -12,9 +18,44 @@ SET_CONTENTS_COLLECTION = DB['set_contents']
 SET_SIMILARITIES_COLLECTION = DB['set_similarities']
 SET_OFFERS_COLLECTION = DB['set_offers']
 COLORS_COLLECTION = DB['colors']
+# Seconds a verified principal is reused without reading the user again
+PRINCIPAL_CACHE_TTL = float(os.getenv('PRINCIPAL_CACHE_TTL', 5))
+PRINCIPAL_PROJECTION = {'_id': 1, 'is_admin': 1, 'token_version': 1}
+
+def get_principal(user_id):
+    """
+    The authorization fields of a user, {_id, is_admin, token_version}.
+
+    Kept in the worker's local cache for PRINCIPAL_CACHE_TTL seconds under the
+    "user:<id>" tag, so invalidating the tag drops it in every worker.
+
+    Returns:
+        dict: The principal, None for unknown users.
+    """
+    key = f"principal:{user_id}"
+    if (principal := LOCAL_CACHE.get(key)) is not None:
+        return principal
+    principal = USERS_COLLECTION.find_one({'_id': user_id}, PRINCIPAL_PROJECTION)
+    if principal:
+        principal.setdefault('is_admin', False)
+        principal.setdefault('token_version', 0)
+        _start_invalidation_listener()
+        LOCAL_CACHE.set(key, principal, PRINCIPAL_CACHE_TTL, size=len(str(principal)), tags=(f"user:{user_id}",))
+    return principal
+
+def revoke_tokens(user_id):
+    """Invalidate every token issued to a user so far by bumping its token version."""
+    result = USERS_COLLECTION.update_one({'_id': user_id}, {'$inc': {'token_version': 1}})
+    invalidate(f"user:{user_id}")
+    return result.matched_count
 
 # Making a token to authenticate users
 def token_required(f):
+    """
+    Verify the JWT and pass the principal ({_id, is_admin, token_version})
+    to the handler as `current_user`. Tokens issued before the user's last
+    token version bump are rejected.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
@@ -23,9 +64,11 @@ def token_required(f):
         try:
             token = token.replace('Bearer ', '')  # Remove 'Bearer ' prefix from token
             data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = USERS_COLLECTION.find_one({'_id': data.get('_id')})
+            current_user = get_principal(data.get('_id'))
             if not current_user:
                 return jsonify({'message': 'Invalid token!'}), 401
+            if data.get('ver', 0) != current_user['token_version']:
+                return jsonify({'message': 'Token has been revoked'}), 401
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
@@ -52,15 +95,15 @@ def login():
     print(f"Attempting login for username: {data.get('username')}")
     
     # Find the user in the database by username
-    user = USERS_COLLECTION.find_one({'_id': data.get('username')})
+    user = USERS_COLLECTION.find_one({'_id': data.get('username')}, {'password': 1, 'token_version': 1})
     
     if user:
-        print(f"Found user: {user}")
+        print(f"Found user: {user['_id']}")
         # Check if the provided password matches the stored password
         if user['password'] == data.get('password'):
-            # Generate a JWT token with user ID and expiration time
+            # Generate a JWT token with user ID, token version and expiration time
             token = jwt.encode(
-                {'_id': user['_id'], 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)}, 
+                {'_id': user['_id'], 'ver': user.get('token_version', 0), 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)}, 
                 current_app.config['SECRET_KEY'], 
                 algorithm='HS256'
             )
@@ -80,10 +123,19 @@ def get_users(current_user):
     if not current_user.get('is_admin', False):
         return jsonify({'message': 'Unauthorized access'}), 403
     
-    result = list(USERS_COLLECTION.find())
-    for user in result:
-        user['_id'] = str(user['_id'])
-    return jsonify(result)
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after')
+
+    cursor = USERS_COLLECTION.find(**listing_find(after, limit=limit))
+    if wants_ndjson(request.accept_mimetypes):
+        return stream_ndjson(cursor, to_user_listing)
+
+    result = [to_user_listing(user) for user in cursor]
+    return jsonify(result), 200, next_page_headers(request.base_url, request.args.to_dict(), result, limit)
+
+def to_user_listing(user):
+    user['_id'] = str(user['_id'])
+    return user
 
 @users_api.route('/', methods=['POST'])
 def create_user():
@@ -106,6 +158,7 @@ def create_user():
     }
     try:
         result = USERS_COLLECTION.insert_one(data)
+        record_stats_change('users', total_users=1)
         return jsonify({'inserted_id': str(result.inserted_id)}), 201
     except DuplicateKeyError:
         return jsonify({'error': f"Part with _id '{data['_id']}' already exists."}), 409
@@ -119,7 +172,7 @@ def get_user(current_user,id):
     if current_user['_id'] != id and not current_user.get('is_admin', False):
         return jsonify({'message': 'Unauthorized access'}), 403
 
-      result = list(USERS_COLLECTION.find({"_id": id}))
+    result = list(USERS_COLLECTION.find({"_id": id}))
     if not result:
         return jsonify({'error': 'User not found'}), 404
     return jsonify(result)
@@ -140,95 +193,138 @@ def get_user_inventory(current_user, id):
     return jsonify(user['inventory']), 200
 
 
-@users_api.route('/<id>/inventory', methods=['POST'])
-@token_required
-def add_items_to_inventory(current_user,id):
-    data = request.json
-    # chacking that curent user is the same as the user requested
-    if current_user['_id'] != id and not current_user.get('is_admin', False):
-        return jsonify({'message': 'Unauthorized access'}), 403
+def _valid_key(key):
+    # Inventory keys become field paths
+    return isinstance(key, str) and key and '.' not in key and not key.startswith('$')
 
-    if not data or not isinstance(data, dict):
-        return jsonify({'error': 'Invalid input. JSON body is required.'}), 400
+def validate_inventory_delta(data, signed=False):
+    """
+    Check an inventory change: {"parts": {part_id: {color: n}}, "sets": {set_id: n}}.
 
-    if 'parts' not in data or 'sets' not in data:
-        return jsonify({'error': 'Both "parts" and "sets" are required in the input.'}), 400
-
-    if 'parts' in data:
-        if not isinstance(data['parts'], dict):
-            return jsonify({'error': "'parts' must be a dictionary with part IDs as keys and colors with quantities as values."}), 400
-        for part_id, colors in data['parts'].items():
-            if not isinstance(colors, dict):
-                return jsonify({'error': f"Part {part_id} colors should be a dictionary."}), 400
-            for color, quantity in colors.items():
-                if not isinstance(quantity, int):
-                    return jsonify({'error': f"Invalid quantity for part {part_id}, color {color}. Must be an integer."}), 400
-
-    if 'sets' in data:
-        if not isinstance(data['sets'], dict):
-            return jsonify({'error': "'sets' must be a dictionary with set IDs as keys and quantities as values."}), 400
-        for set_id, quantity in data['sets'].items():
-            if not isinstance(quantity, int):
-                return jsonify({'error': f"Invalid quantity for set {set_id}. Must be an integer."}), 400
-
-    user = USERS_COLLECTION.find_one({"_id": id})
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    Args:
+        signed (bool): Accept any integer (deltas), otherwise quantities must be positive.
 
+    Returns:
+        str: The error message, None when the change is valid.
+    """
+    if not data or not isinstance(data, dict):
+        return 'Invalid input. JSON body is required.'
+
+    if 'parts' not in data and 'sets' not in data:
+        return 'At least one of "parts" and "sets" is required in the input.'
+
+    def valid_quantity(quantity):
+        return isinstance(quantity, int) and not isinstance(quantity, bool) and (signed or quantity > 0)
+    expected = 'an integer' if signed else 'a positive integer'
+
+    parts = data.get('parts', {})
+    if not isinstance(parts, dict):
+        return "'parts' must be a dictionary with part IDs as keys and colors with quantities as values."
+    for part_id, colors in parts.items():
+        if not _valid_key(part_id):
+            return f"Invalid part ID '{part_id}'."
+        if not isinstance(colors, dict):
+            return f"Part {part_id} colors should be a dictionary."
+        for color, quantity in colors.items():
+            if not _valid_key(color):
+                return f"Invalid color '{color}' for part {part_id}."
+            if not valid_quantity(quantity):
+                return f"Invalid quantity for part {part_id}, color {color}. Must be {expected}."
+
+    sets = data.get('sets', {})
+    if not isinstance(sets, dict):
+        return "'sets' must be a dictionary with set IDs as keys and quantities as values."
+    for set_id, quantity in sets.items():
+        if not _valid_key(set_id):
+            return f"Invalid set ID '{set_id}'."
+        if not valid_quantity(quantity):
+            return f"Invalid quantity for set {set_id}. Must be {expected}."
+
+def inventory_deltas(data, sign=1):
+    """{field path: delta} of an inventory change."""
+    deltas = {}
     for part_id, colors in data.get('parts', {}).items():
-        if part_id not in user['inventory']['parts']:
-            user['inventory']['parts'][part_id] = {}
         for color, quantity in colors.items():
-            if color not in user['inventory']['parts'][part_id]:
-                user['inventory']['parts'][part_id][color] = 0
-            user['inventory']['parts'][part_id][color] += quantity
-
+            deltas[f"inventory.parts.{part_id}.{color}"] = sign * quantity
     for set_id, quantity in data.get('sets', {}).items():
-        if set_id not in user['inventory']['sets']:
-            user['inventory']['sets'][set_id] = 0
-        user['inventory']['sets'][set_id] += quantity
+        deltas[f"inventory.sets.{set_id}"] = sign * quantity
+    return {path: delta for path, delta in deltas.items() if delta}
+
+def apply_inventory_deltas(user_id, deltas):
+    """
+    Add deltas to inventory quantities without reading or rewriting the inventory.
+
+    The deltas are sent as a single $inc update, so a change is applied
+    entirely or not at all (a paths-only update stays far below the 16 MB
+    document limit). Then every decremented entry that reached zero or below
+    is unset, and so is every part left without colors. Each unset is guarded
+    by its condition, so a concurrent increment is never lost.
+
+    Raises:
+        WriteError: When a path cannot be incremented, e.g. a part stored as a
+            plain number by older versions. Nothing is applied then.
+
+    Returns:
+        dict: The touched entries as {"parts": ..., "sets": ...}, None for unknown users.
+    """
+    paths = list(deltas)
+    if not paths:
+        return {"parts": {}, "sets": {}} if USERS_COLLECTION.find_one({"_id": user_id}, {"_id": 1}) else None
+    if USERS_COLLECTION.update_one({"_id": user_id}, {"$inc": deltas}).matched_count == 0:
+        return None
+
+    decremented = [path for path, delta in deltas.items() if delta < 0]
+    emptied_parts = {path.rsplit('.', 1)[0] for path in decremented if path.startswith('inventory.parts.')}
+    cleanup = [UpdateOne({"_id": user_id, path: {"$lte": 0}}, {"$unset": {path: ""}}) for path in decremented]
+    cleanup += [UpdateOne({"_id": user_id, path: {}}, {"$unset": {path: ""}}) for path in sorted(emptied_parts)]
+    if cleanup:
+        # Ordered: parts are only checked for emptiness once their colors are unset
+        USERS_COLLECTION.bulk_write(cleanup)
+
+    user = USERS_COLLECTION.find_one({"_id": user_id}, {path: 1 for path in paths}) or {}
+    inventory = user.get('inventory', {})
+    return {"parts": inventory.get('parts', {}), "sets": inventory.get('sets', {})}
+
+def _change_inventory(current_user, id, signed=False, sign=1):
+    # chacking that curent user is the same as the user requested
+    if current_user['_id'] != id and not current_user.get('is_admin', False):
+        return jsonify({'message': 'Unauthorized access'}), 403
 
-    result = USERS_COLLECTION.update_one({"_id": id}, {"$set": user})
+    data = request.json
+    error_message = validate_inventory_delta(data, signed)
+    if error_message:
+        return jsonify({'error': error_message}), 400
 
-    if result.matched_count == 0:
-        return jsonify({'error': 'Operation failed'}), 400
+    try:
+        changed = apply_inventory_deltas(id, inventory_deltas(data, sign))
+    except WriteError as e:
+        return jsonify({'error': 'The change conflicts with the stored inventory, nothing was applied.', 'details': str(e)}), 409
+    if changed is None:
+        return jsonify({'error': 'User not found'}), 404
+    record_stats_change('users')
 
-    return jsonify(user['inventory'])
+    return jsonify(changed), 200
+
+@users_api.route('/<id>/inventory', methods=['POST'])
+@token_required
+def add_items_to_inventory(current_user,id):
+    """Add quantities to the inventory, negative ones remove. Returns the new quantities of the touched entries."""
+    return _change_inventory(current_user, id, signed=True)
 
 @users_api.route('/<id>/inventory', methods=['DELETE'])
 @token_required
 def remove_items_from_inventory(current_user,id):
-    data = request.json
-    # chacking that curent user is the same as the user requested
-    if current_user['_id'] != id and not current_user.get('is_admin', False):
-        return jsonify({'message': 'Unauthorized access'}), 403
-
-    if not data or not isinstance(data, dict):
-        return jsonify({'error': 'Invalid input. JSON body is required.'}), 400
-
-    if 'parts' in data and not isinstance(data['parts'], dict):
-        return jsonify({'error': "'parts' must be a dictionary with part IDs as keys, colors and quantities as values."}), 400
-
-    if 'sets' in data and not isinstance(data['sets'], dict):
-        return jsonify({'error': "'sets' must be a dictionary with set IDs as keys and quantities as values."}), 400
-    
-    user = USERS_COLLECTION.find_one({"_id": id})
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
-    for part_id, quantity in data.get('parts', {}).items():
-        if part_id not in user['inventory']['parts']:
-            return jsonify({'error': f"Part with ID '{part_id}' not found in user's inventory."}), 404
-        user['inventory']['parts'][part_id] -= quantity
-        if user['inventory']['parts'][part_id] <= 0:
-            del user['inventory']['parts'][part_id]
+    """Remove quantities from the inventory, entries reaching zero are dropped."""
+    return _change_inventory(current_user, id, sign=-1)
 
-    for set_id, quantity in data.get('sets', {}).items():
-        if set_id not in user['inventory']['sets']:
-            return jsonify({'error': f"Set with ID '{set_id}' not found in user's inventory."}), 404
-        user['inventory']['sets'][set_id] -= quantity
-        if user['inventory']['sets'][set_id] <= 0:
-            del user['inventory']['sets'][set_id]
+@users_api.route('/<id>/inventory', methods=['PATCH'])
+@token_required
+def patch_inventory(current_user, id):
+    """
+    Apply a batch of signed deltas to the inventory, e.g.
+    {"parts": {"3001": {"4": 2, "1": -1}}, "sets": {"10001-1": -1}}.
+    """
+    return _change_inventory(current_user, id, signed=True)
 
 #  the rest of the crud operations for users
 @users_api.route('/<id>', methods=['PUT'])
@@ -291,9 +387,17 @@ def update_user(current_user,id):
         update_fields['inventory'] = inventory_updates
     
     if update_fields:
-        result = USERS_COLLECTION.update_one({"_id": id}, {"$set": update_fields})
+        update = {"$set": update_fields}
+        # A new password revokes the tokens issued with the old one
+        if 'password' in update_fields:
+            update["$inc"] = {"token_version": 1}
+        result = USERS_COLLECTION.update_one({"_id": id}, update)
         if result.matched_count == 0:
             return jsonify({'error': 'Update failed'}), 400
+        if 'password' in update_fields or 'is_admin' in update_fields:
+            invalidate(f"user:{id}")
+        if 'inventory' in update_fields:
+            record_stats_change('users')
         return jsonify({'message': 'User updated successfully'}), 200
     else:
         return jsonify({'error': 'No valid fields to update'}), 400
@@ -307,10 +411,30 @@ def delete_user(current_user,id):
     if current_user['_id'] != id and not current_user.get('is_admin', False):
         return jsonify({'message': 'Unauthorized access'}), 403
 
-    USERS_COLLECTION.delete_one({"_id": id})
+    result = USERS_COLLECTION.delete_one({"_id": id})
+    if result.deleted_count:
+        invalidate(f"user:{id}")
+        record_stats_change('users', total_users=-1)
     return jsonify({'message': f'User {id} deleted successfully'}), 200
 
 
+@users_api.route('/<id>/revoke', methods=['POST'])
+@token_required
+def revoke_user_tokens(current_user, id):
+    # chacking that curent user is the same as the user requested
+    if current_user['_id'] != id and not current_user.get('is_admin', False):
+        return jsonify({'message': 'Unauthorized access'}), 403
+
+    if not revoke_tokens(id):
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify({'message': f'Tokens of user {id} revoked'}), 200
+
+def _pricing_policy():
+    policy = request.args.get('policy', 'max')
+    if policy not in PRICING_POLICIES:
+        return None
+    return policy
+
 #  most expensive owned part (include parts contained in sets)
 @users_api.route('/<id>/inventory/most_expensive_part')
 @token_required
@@ -318,77 +442,49 @@ def most_expensive_part(current_user, id):
     # chacking that curent user is the same as the user requested
     if current_user['_id'] != id and not current_user.get('is_admin', False):
         return jsonify({'message': 'Unauthorized access'}), 403
-      
-    user = USERS_COLLECTION.find_one({"_id": id})
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
 
-    most_expensive_part = None
-    max_price = 0
+    policy = _pricing_policy()
+    if not policy:
+        return jsonify({'error': f"Invalid policy. Must be one of: {', '.join(PRICING_POLICIES)}."}), 400
 
-    if 'inventory' in user and 'parts' in user['inventory']:
-        for part_id, colors in user['inventory']['parts'].items():
-            # Find the part in PARTS_COLLECTION
-            part = PARTS_COLLECTION.find_one({"_id": part_id})
-            if part:
-                # Part exists, check the prices of its colors
-                for color, quantity in colors.items():
-                    # Check if there are colors and prices in this part
-                    if 'colors' in part and isinstance(part['colors'], dict):
-                        color_entries = part['colors'].get(color, [])
-                        for entry in color_entries:
-                            if isinstance(entry, dict) and 'Price' in entry:
-                                price = entry['Price']  # Price of this color
-                                total_price = price * quantity 
-                                if total_price > max_price:
-                                    max_price = total_price
-                                    most_expensive_part = part_id
-
-    if most_expensive_part:
-        return jsonify({'most_expensive_part': most_expensive_part, 'price': max_price})
+    try:
+        owned_parts = _get_all_parts(id)
+    except KeyError:
+        return jsonify({'error': 'User not found'}), 404
+
+    most_expensive = value_parts(owned_parts, policy)['most_expensive_part']
+    if most_expensive:
+        return jsonify({
+            'most_expensive_part': most_expensive['part_id'],
+            'color': most_expensive['color'],
+            'price': most_expensive['price']
+        })
     else:
         return jsonify({'error': 'No parts found in inventory.'}), 404
 
 @users_api.route('/<id>/inventory/total_value')
 @token_required
 def total_value_of_owned_parts(current_user,id):
-    user = USERS_COLLECTION.find_one({"_id": id})
     # chacking that curent user is the same as the user requested
     if current_user['_id'] != id and not current_user.get('is_admin', False):
         return jsonify({'message': 'Unauthorized access'}), 403
 
-    total_value = 0
-    # Check parts in user's inventory
-    if 'inventory' in user and 'parts' in user['inventory']:
-        for part_id, colors in user['inventory']['parts'].items():
-            # Find the part in PARTS_COLLECTION
-            part = PARTS_COLLECTION.find_one({"_id": part_id})
-            if part:
-                # Part exists, check the prices of its colors
-                for color, quantity in colors.items():
-                    # Check if there are colors and prices in this part
-                    if 'colors' in part and isinstance(part['colors'], dict):
-                        color_entries = part['colors'].get(color, [])
-                        
-                        # If we have prices for this color, find the highest price
-                        if color_entries:
-                            max_price = 0
-                            for entry in color_entries:
-                                if isinstance(entry, dict) and 'Price' in entry:
-                                    price = entry['Price']
-                                    if price > max_price:
-                                        max_price = price  # Choose the highest price for this color
-
-                            if max_price > 0:  # If we have a price for this color
-                                total_price = max_price * quantity  # Total price = price * quantity
-                                total_value += total_price  # Sum the values of all parts
-
-    # Return the total value of owned parts
+    policy = _pricing_policy()
+    if not policy:
+        return jsonify({'error': f"Invalid policy. Must be one of: {', '.join(PRICING_POLICIES)}."}), 400
+
+    # Parts contained in owned sets are valued as well
+    try:
+        owned_parts = _get_all_parts(id)
+    except KeyError:
+        return jsonify({'error': 'User not found'}), 404
+
+    total_value = value_parts(owned_parts, policy)['total_value']
     return jsonify({'total_value': round(total_value, 2)})
 
 @users_api.route('/<id>/inventory/completed/<top_count>', methods=['GET'])
 @token_required
-def set_completed_percentage(id, top_count, current_user):
+def set_completed_percentage(current_user, id, top_count):
     top_count = int(top_count)
     # chacking that curent user is the same as the user requested
     if current_user['_id'] != id and not current_user.get('is_admin', False):
@@ -462,20 +558,21 @@ def set_completed_percentage(id, top_count, current_user):
     return jsonify(final_percentage)     
 
 def _get_all_parts(uid):
-    user = USERS_COLLECTION.find_one({"_id": uid})
+    user = USERS_COLLECTION.find_one({"_id": uid}, {"inventory": 1})
     if user is None:
         raise KeyError(uid)
     all_parts = {}
     for part_id, colors in user['inventory']['parts'].items():
         for color, quantity in colors.items():
-            all_parts[(part_id, color)] = quantity
+            all_parts[(part_id, str(color))] = quantity
 
-    for brickset in user['inventory']['sets']:
-        for part_id, val in SET_CONTENTS_COLLECTION.find_one({"_id": brickset})["parts"].items():
-            if (part_id, val["color"]) in all_parts:
-                all_parts[(part_id, val["color"])] += val["quantity"]
-            else:
-                all_parts[(part_id, val["color"])] = val["quantity"]
+    # Contents of every owned set in a single query
+    owned_sets = user['inventory']['sets']
+    for set_contents in SET_CONTENTS_COLLECTION.find({"_id": {"$in": list(owned_sets)}}, {"parts": 1}):
+        copies = owned_sets[set_contents["_id"]]
+        for part_id, val in set_contents["parts"].items():
+            key = (part_id, str(val["color"]))
+            all_parts[key] = all_parts.get(key, 0) + val["quantity"] * copies
 
     return all_parts
 
@@ -490,19 +587,8 @@ def find_cheapest_from_inventory(current_user,id):
     user_parts = _get_all_parts(id)
     completed_percentages = []
 
-    all_sets = SET_CONTENTS_COLLECTION.find()
-
-    for set_doc in all_sets:
-        set_id = set_doc["_id"]
-        set_parts = set_doc["parts"]
-        total_parts_in_set = 0
-        owned_parts_count = 0
-
-        for part_id, part_info in set_parts.items():
-            total_parts_in_set += part_info["quantity"]
-            user_quantity = user_parts.get((part_id, part_info["color"]), 0)
-            owned_parts_count += min(user_quantity, part_info["quantity"])
-
+    # Only sets sharing at least one part with the inventory can be partially completed
+    for set_id, (owned_parts_count, total_parts_in_set) in set_completion(user_parts).items():
         if total_parts_in_set > 0:
             completion_percentage = (owned_parts_count / total_parts_in_set) * 100
         else:
@@ -520,13 +606,18 @@ def find_cheapest_from_inventory(current_user,id):
     cheapest_set = None
     min_price = float('inf')
 
+    overviews = {
+        overview["_id"]: overview
+        for overview in SET_OVERVIEWS_COLLECTION.find({"_id": {"$in": [s["set_id"] for s in completed_percentages]}})
+    }
+
     for set_info in completed_percentages:
         set_id = set_info["set_id"]
 
-        set_overview = SET_OVERVIEWS_COLLECTION.find_one({"_id": set_id})
+        set_overview = overviews.get(set_id)
         if set_overview and "min_offer" in set_overview:
             if set_overview["min_offer"] < min_price:
-                min_offer = set_overview["min_offer"]
+                min_price = set_overview["min_offer"]
                 cheapest_set = {
                     "set_id": set_id,
                     "name": set_overview["name"],
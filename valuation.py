@@ -0,0 +1,88 @@
+from imports import *
+from part_colors import colors_to_dict, PARTS_COLORS_LAYOUT
+import statistics
+
+PARTS_COLLECTION = DB['parts']
+
+# How a single unit of a part in a given color is priced from its offers
+PRICING_POLICIES = {
+    'min': min,
+    'max': max,
+    'median': statistics.median,
+}
+
+def fetch_unit_prices(part_keys, policy='max'):
+    """
+    Fetch the unit price of many (part, color) pairs in a single query.
+
+    Only the colors that are actually needed are projected. The min and max
+    policies read the stored price summaries, so the offers themselves never
+    leave the database; the median needs the offer prices.
+
+    Args:
+        part_keys (iterable): (part_id, color) pairs.
+        policy (str): Unit pricing policy, one of PRICING_POLICIES.
+
+    Returns:
+        dict: {(part_id, color): unit price} for pairs that have at least one priced offer.
+    """
+    part_keys = list(part_keys)
+    if not part_keys:
+        return {}
+    part_ids = {part_id for part_id, _ in part_keys}
+
+    if policy in ('min', 'max'):
+        field = f"{policy}_price"
+        projection = {f"price_summary.colors.{color}.{field}": 1 for _, color in part_keys}
+        prices = {}
+        for part in PARTS_COLLECTION.find(**by_ids_find(part_ids, projection)):
+            for color, summary in part.get('price_summary', {}).get('colors', {}).items():
+                if summary.get(field) is not None:
+                    prices[(part['_id'], color)] = summary[field]
+        return prices
+
+    price_of = PRICING_POLICIES[policy]
+    # Only the object layout can project single colors by path
+    if PARTS_COLORS_LAYOUT == 'object':
+        projection = {f"colors.{color}": 1 for _, color in part_keys}
+    else:
+        projection = {"colors": 1}
+    wanted = set(part_keys)
+    prices = {}
+    for part in PARTS_COLLECTION.find(**by_ids_find(part_ids, projection)):
+        colors = part.get('colors')
+        if not isinstance(colors, (dict, list)):
+            continue
+        for color, offers in colors_to_dict(colors).items():
+            if (part['_id'], color) not in wanted:
+                continue
+            color_prices = [offer['Price'] for offer in offers if isinstance(offer, dict) and 'Price' in offer]
+            if color_prices:
+                prices[(part['_id'], color)] = price_of(color_prices)
+    return prices
+
+def value_parts(owned_parts, policy='max'):
+    """
+    Value an expanded inventory in one pass.
+
+    Args:
+        owned_parts (dict): {(part_id, color): quantity} as built by user._get_all_parts.
+        policy (str): Unit pricing policy, one of PRICING_POLICIES.
+
+    Returns:
+        dict: total_value plus the most_expensive_part entry (part_id, color, quantity, price),
+            which is None when nothing in the inventory has a price.
+    """
+    prices = fetch_unit_prices(owned_parts.keys(), policy)
+
+    total_value = 0
+    most_expensive = None
+    for (part_id, color), quantity in owned_parts.items():
+        if (part_id, color) not in prices:
+            continue
+        value = prices[(part_id, color)] * quantity
+        total_value += value
+        if value > 0 and (most_expensive is None or value > most_expensive['price']):
+            most_expensive = {'part_id': part_id, 'color': color, 'quantity': quantity, 'price': value}
+
+    return {'total_value': total_value, 'most_expensive_part': most_expensive}